@@ -12,7 +12,7 @@ from .boolean_utils import (
 )
 from .analysis_view import HistogramView, ColorWheelView
 from .tonal_adjust import LevelsAdjust, AutoLevels, BrightnessContrastAdjust
-from .color_blend import ColorMatchBlend, ColorAdjustBlend
+from .color_blend import ColorMatchBlend, ColorAdjustBlend, ReferenceColorStats
 from .remove_background import RemoveBackgroundPro, MaskEditor, ApplyMask
 
 # Standalone files
@@ -20,7 +20,9 @@ from .image_blend_pro import ImageBlendPro
 from .curves_adjust_pro import CurvesAdjustPro
 from .channel_mask_pro import ChannelMaskPro
 from .selective_color_pro import SelectiveColorPro
-from .lut_apply import LUTApply
+from .lut_apply import LUTApply, LUTStack, LUTContactSheet
+from .grade_stack import GradeStack
+from .color_match_lut import ColorMatchLUT
 from .seed_lock import SeedLock
 from .text_notes import TextNotes
 from .show_text import ShowText
@@ -39,7 +41,12 @@ NODE_CLASS_MAPPINGS = {
     "SelectiveColorPro": SelectiveColorPro,
     "ColorMatchBlend": ColorMatchBlend,
     "ColorAdjustBlend": ColorAdjustBlend,
+    "ReferenceColorStats": ReferenceColorStats,
     "LUTApply": LUTApply,
+    "LUTStack": LUTStack,
+    "LUTContactSheet": LUTContactSheet,
+    "GradeStack": GradeStack,
+    "ColorMatchLUT": ColorMatchLUT,
     # Blending
     "ImageBlendPro": ImageBlendPro,
     # Mask & Background
@@ -79,7 +86,12 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "SelectiveColorPro": "👾 Selective Color Pro",
     "ColorMatchBlend": "👾 Color Match Blend",
     "ColorAdjustBlend": "👾 Color Adjust Blend",
+    "ReferenceColorStats": "👾 Reference Color Stats",
     "LUTApply": "👾 LUT Apply",
+    "LUTStack": "👾 LUT Stack",
+    "LUTContactSheet": "👾 LUT Contact Sheet",
+    "GradeStack": "👾 Grade Stack",
+    "ColorMatchLUT": "👾 Color Match LUT",
     # Blending
     "ImageBlendPro": "👾 Image Blend Pro",
     # Mask & Background
@@ -113,4 +125,4 @@ NODE_DISPLAY_NAME_MAPPINGS = {
 WEB_DIRECTORY = "./js"
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS", "WEB_DIRECTORY"]
 
-print("ComfyUI-MachinePaintingNodes v2.0.5: Loaded 33 nodes")
+print("ComfyUI-MachinePaintingNodes v2.0.5: Loaded 38 nodes")
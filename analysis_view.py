@@ -1,9 +1,9 @@
-import torch
 import numpy as np
 import cv2
 from PIL import Image
 import folder_paths
 import os
+from .image_utils import image_view, to_uint8
 
 class HistogramView:
     """
@@ -34,7 +34,7 @@ class HistogramView:
     def create_histogram(self, image, show_rgb=True, show_luminance=True, 
                          line_thickness=1, background="black", unique_id=None):
         
-        img = (image[0].cpu().numpy() * 255).astype(np.uint8)
+        img = to_uint8(image_view(image)[0])
         
         # Fixed size
         width = 400
@@ -142,7 +142,7 @@ class ColorWheelView:
 
     def create_vectorscope(self, image, intensity=1.0, show_skin_line=True, 
                            show_color_targets=True, unique_id=None):
-        img = (image[0].cpu().numpy() * 255).astype(np.uint8)
+        img = to_uint8(image_view(image)[0])
         
         # Fixed size
         size = 400
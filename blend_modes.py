@@ -0,0 +1,145 @@
+import numpy as np
+import cv2
+
+# Every mode understood by blend(); the blending nodes offer all of them
+BLEND_MODES = ["normal", "overlay", "multiply", "screen", "soft_light",
+               "hard_light", "linear_light", "difference", "color", "luminosity",
+               "darken", "lighten", "color_dodge", "color_burn", "exclusion"]
+# Divisions by (1 - top) and top are floored here, so dodge/burn saturate instead of dividing by zero
+DIVIDE_FLOOR = 1e-6
+
+
+def blend(bottom, top, mode="normal", opacity=1.0, out=None, legacy=False):
+    """
+    Blend float RGB top onto bottom (both 0-1) and mix the result over bottom by opacity.
+    Each mode is evaluated in place in out (allocated when not given, and never bottom or
+    top) with at most one scratch buffer; no mode evaluates both sides of a branch.
+    legacy selects Image Blend Pro's original overlay, color dodge and color burn.
+    Returns out as float32, clipped to 0-1.
+    """
+    if out is None:
+        out = np.empty(np.shape(bottom), dtype=np.float32)
+
+    if mode not in BLEND_MODES or mode == "normal":
+        # Plain mix, one pass
+        cv2.addWeighted(np.ascontiguousarray(top, dtype=np.float32), opacity,
+                        np.ascontiguousarray(bottom, dtype=np.float32), 1.0 - opacity, 0.0, dst=out)
+        return np.clip(out, 0, 1, out=out)
+
+    if mode == "multiply":
+        np.multiply(bottom, top, out=out)
+    elif mode == "screen":
+        # 1 - (1 - b)(1 - t) = b + t - bt
+        np.multiply(bottom, top, out=out)
+        np.subtract(bottom, out, out=out)
+        out += top
+    elif mode == "overlay" and legacy:
+        legacy_overlay(bottom, top, out)
+    elif mode == "overlay":
+        hard_light(top, bottom, out)
+    elif mode == "hard_light":
+        hard_light(bottom, top, out)
+    elif mode == "soft_light":
+        # (1 - 2t) b^2 + 2tb = b^2 + 2t b (1 - b)
+        scratch = np.multiply(bottom, bottom, dtype=np.float32)
+        np.subtract(bottom, scratch, out=out)
+        out *= top
+        out *= 2
+        out += scratch
+    elif mode == "linear_light":
+        np.multiply(top, 2, out=out)
+        out += bottom
+        out -= 1
+    elif mode == "difference":
+        np.subtract(bottom, top, out=out)
+        np.abs(out, out=out)
+    elif mode == "darken":
+        np.minimum(bottom, top, out=out)
+    elif mode == "lighten":
+        np.maximum(bottom, top, out=out)
+    elif mode == "color_dodge":
+        # b / (1 - t)
+        np.subtract(1, top, out=out)
+        np.maximum(out, DIVIDE_FLOOR, out=out)
+        np.divide(bottom, out, out=out)
+        if legacy:
+            # A black top gave black rather than the bottom
+            np.copyto(out, 0, where=top == 0)
+    elif mode == "color_burn":
+        # 1 - (1 - b) / t
+        scratch = np.maximum(top, DIVIDE_FLOOR, dtype=np.float32)
+        np.subtract(1, bottom, out=out)
+        out /= scratch
+        np.subtract(1, out, out=out)
+        if legacy:
+            # A white top gave white rather than the bottom
+            np.copyto(out, 1, where=top == 1)
+    elif mode == "exclusion":
+        # b + t - 2bt
+        np.multiply(bottom, top, out=out)
+        out *= -2
+        out += bottom
+        out += top
+    elif mode == "color":
+        # Hue and saturation of top, value of bottom
+        hsv_value(top, bottom, out)
+    else:  # luminosity
+        # Hue and saturation of bottom, value of top
+        hsv_value(bottom, top, out)
+
+    # The legacy overlay reaches 2 in the highlights and was mixed by opacity before clipping
+    clip_after_mix = legacy and mode == "overlay"
+    if not clip_after_mix:
+        np.clip(out, 0, 1, out=out)
+    if opacity < 1.0:
+        # out = bottom + opacity * (out - bottom)
+        out -= bottom
+        out *= opacity
+        out += bottom
+    if clip_after_mix:
+        np.clip(out, 0, 1, out=out)
+    return out
+
+
+def hard_light(bottom, top, out):
+    """
+    2bt where top < 0.5, else 1 - 2(1 - b)(1 - t), into out. Written branch-free as
+    2b min(t, 0.5) + 2(1 - b)(max(t, 0.5) - 0.5), since masked selects are slow on images.
+    """
+    scratch = np.maximum(top, 0.5, dtype=np.float32)
+    scratch -= 0.5
+    scratch *= 2
+    np.minimum(top, 0.5, out=out)
+    out *= 2
+    out -= scratch
+    out *= bottom
+    out += scratch
+    return out
+
+
+def legacy_overlay(bottom, top, out):
+    """
+    Image Blend Pro's original overlay, into out: 2b(1 - (1 - b)(1 - t)) where bottom < 0.5,
+    else 2bt. Written as 2bt plus 2b^2(1 - t) times a 0/1 step, since masked adds are slow.
+    """
+    scratch = np.subtract(1, top, dtype=np.float32)
+    scratch *= bottom
+    scratch *= bottom
+    scratch *= 2
+    scratch *= bottom < 0.5
+    np.multiply(bottom, top, out=out)
+    out *= 2
+    out += scratch
+    return out
+
+
+def hsv_value(color, value, out):
+    """
+    Take hue and saturation from color and the HSV value (max channel) from value, into out.
+    Batches are stacked into one (B * H, W, 3) image, so frames and whole batches convert alike.
+    """
+    rows = (-1,) + out.shape[-2:]
+    hsv = cv2.cvtColor(np.ascontiguousarray(color, dtype=np.float32).reshape(rows), cv2.COLOR_RGB2HSV)
+    np.max(value, axis=-1, out=hsv[..., 2].reshape(out.shape[:-1]))
+    cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB, dst=out.reshape(rows))
+    return out
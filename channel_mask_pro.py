@@ -1,9 +1,10 @@
-import torch
 import numpy as np
 from PIL import Image
 import folder_paths
 import os
 import cv2
+from .image_utils import image_view, image_tensor, mask_batch, mask_channels, to_uint8
+from .tone_lut import tone_lut
 
 class ChannelMaskPro:
     """
@@ -44,7 +45,8 @@ class ChannelMaskPro:
     FUNCTION = "separate_channels"
     CATEGORY = "MachinePaintingNodes/Mask"
 
-    def apply_levels(self, channel, black_point, white_point, gamma):
+    @staticmethod
+    def apply_levels(channel, black_point, white_point, gamma):
         """Apply levels adjustment to a channel."""
         # Normalize to black/white points
         result = (channel - black_point) / (white_point - black_point)
@@ -53,7 +55,8 @@ class ChannelMaskPro:
         result = np.power(result, 1.0 / gamma)
         return result
 
-    def apply_contrast_brightness(self, channel, contrast, brightness):
+    @staticmethod
+    def apply_contrast_brightness(channel, contrast, brightness):
         """Apply contrast and brightness to a channel."""
         # Contrast: -100 to 100 -> 0.5 to 1.5 multiplier
         contrast_factor = 1.0 + (contrast / 100.0)
@@ -64,41 +67,36 @@ class ChannelMaskPro:
         result = result + brightness_factor
         return np.clip(result, 0, 1)
 
-    def process_channel(self, channel, black_point, white_point, gamma, contrast, brightness, invert):
-        """Apply all adjustments to a channel."""
-        result = channel.copy()
+    @staticmethod
+    def process_channel(channel, black_point, white_point, gamma, contrast, brightness, invert):
+        """Apply all adjustments to a channel. Baked into a cached tone LUT by separate_channels."""
+        result = np.array(channel, dtype=np.float32)
         
         # Apply levels
         if black_point > 0 or white_point < 1 or gamma != 1.0:
-            result = self.apply_levels(result, black_point, white_point, gamma)
+            result = ChannelMaskPro.apply_levels(result, black_point, white_point, gamma)
         
         # Apply contrast/brightness
         if contrast != 0 or brightness != 0:
-            result = self.apply_contrast_brightness(result, contrast, brightness)
+            result = ChannelMaskPro.apply_contrast_brightness(result, contrast, brightness)
         
         # Invert
         if invert:
             result = 1.0 - result
         
-        return result.astype(np.float32)
+        return result.astype(np.float32, copy=False)
 
     def separate_channels(self, image, mask=None, invert_input_mask=False,
                           black_point=0.0, white_point=1.0, gamma=1.0,
                           contrast=0.0, brightness=0.0, invert_channel_mask=False,
                           preview_channel="all", unique_id=None):
-        img = image[0].cpu().numpy()
-        h, w = img.shape[:2]
+        # Channel adjustments are per value, so the whole [B, H, W, C] batch is processed at once
+        img = image_view(image)
+        batch, h, w = img.shape[:3]
         
         # Handle input mask
         if mask is not None:
-            if len(mask.shape) == 3:
-                input_mask = mask[0].cpu().numpy()
-            else:
-                input_mask = mask.cpu().numpy()
-            
-            # Resize mask if needed
-            if input_mask.shape[:2] != (h, w):
-                input_mask = cv2.resize(input_mask, (w, h), interpolation=cv2.INTER_LINEAR)
+            input_mask = mask_batch(mask, batch, h, w)
             
             # Invert input mask if requested
             if invert_input_mask:
@@ -106,22 +104,28 @@ class ChannelMaskPro:
         else:
             input_mask = None
         
-        # Extract RGB channels
-        red = img[:, :, 0].astype(np.float32)
-        green = img[:, :, 1].astype(np.float32)
-        blue = img[:, :, 2].astype(np.float32)
+        # Every channel gets the same per-value adjustment, so one table lookup covers them all
+        params = (black_point, white_point, gamma, contrast, brightness, invert_channel_mask)
+        levels_active = black_point > 0 or white_point < 1 or gamma != 1.0
+        if levels_active or contrast != 0 or brightness != 0:
+            # Levels clamp their input; without them the contrast line continues past 0-1
+            lut = tone_lut(self.process_channel, params, extrapolate=not levels_active)
+            adjusted = lut.apply(img)
+        elif invert_channel_mask:
+            adjusted = 1.0 - img
+        else:
+            adjusted = img
         
-        # Check for alpha channel (if 4 channels)
-        if img.shape[2] == 4:
-            alpha = img[:, :, 3].astype(np.float32)
+        # Check for alpha channel (if 4 channels), otherwise alpha is a constant plane
+        if img.shape[-1] == 4:
+            alpha = adjusted[..., 3]
         else:
-            alpha = np.ones((h, w), dtype=np.float32)
+            alpha_value = self.process_channel(np.ones(1, dtype=np.float32), *params)[0]
+            alpha = np.full((batch, h, w), alpha_value, dtype=np.float32)
         
-        # Apply adjustments to each channel
-        red = self.process_channel(red, black_point, white_point, gamma, contrast, brightness, invert_channel_mask)
-        green = self.process_channel(green, black_point, white_point, gamma, contrast, brightness, invert_channel_mask)
-        blue = self.process_channel(blue, black_point, white_point, gamma, contrast, brightness, invert_channel_mask)
-        alpha = self.process_channel(alpha, black_point, white_point, gamma, contrast, brightness, invert_channel_mask)
+        red = adjusted[..., 0]
+        green = adjusted[..., 1]
+        blue = adjusted[..., 2]
         
         # Apply input mask to all channel outputs if provided
         if input_mask is not None:
@@ -130,14 +134,14 @@ class ChannelMaskPro:
             blue = blue * input_mask
             alpha = alpha * input_mask
         
-        # Masks (single channel)
-        red_mask = torch.from_numpy(red).unsqueeze(0)
-        green_mask = torch.from_numpy(green).unsqueeze(0)
-        blue_mask = torch.from_numpy(blue).unsqueeze(0)
-        alpha_mask = torch.from_numpy(alpha).unsqueeze(0)
+        # Masks (single channel, one per frame)
+        red_mask = image_tensor(red)
+        green_mask = image_tensor(green)
+        blue_mask = image_tensor(blue)
+        alpha_mask = image_tensor(alpha)
         
-        # Create preview image
-        preview_img = self.create_preview(red, green, blue, alpha, preview_channel)
+        # Create preview image from the first frame
+        preview_img = self.create_preview(red[0], green[0], blue[0], alpha[0], preview_channel)
         preview_results = self.save_preview(preview_img, unique_id)
         
         return {
@@ -164,7 +168,7 @@ class ChannelMaskPro:
             preview = np.zeros((grid_h, grid_w, 3), dtype=np.uint8)
             
             def resize_channel(ch):
-                ch_uint8 = (ch * 255).astype(np.uint8)
+                ch_uint8 = to_uint8(ch)
                 pil_img = Image.fromarray(ch_uint8, mode='L')
                 pil_img = pil_img.resize((preview_w, preview_h), Image.LANCZOS)
                 return np.array(pil_img)
@@ -208,7 +212,8 @@ class ChannelMaskPro:
             # Single channel preview
             channel_map = {"red": red, "green": green, "blue": blue, "alpha": alpha}
             ch = channel_map.get(mode, red)
-            preview = (np.stack([ch, ch, ch], axis=2) * 255).astype(np.uint8)
+            # PIL needs real pixel memory, so the broadcast view is copied once here
+            preview = np.ascontiguousarray(mask_channels(to_uint8(ch)))
         
         return preview
 
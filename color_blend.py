@@ -1,24 +1,70 @@
-import torch
+import os
 import numpy as np
 import cv2
+from .image_utils import (batch_index, image_view, mask_batch, scale_channels, transform_channels,
+                          guided_upsample, frames_to_image)
+from .color_stats import (STATS_RESOLUTIONS, rgb_to_lab, lab_to_rgb, to_lab8, stats_proxy, stats_weights,
+                          batch_proxy, batch_weights, batch_moments, lab_histograms, lab_stats, tile_moments, tile_stats,
+                          moving_average, temporal_stats, image_stats, fingerprint, stats_fingerprint)
+from .blend_modes import BLEND_MODES, blend
+from .lut_apply import LUTCache
+
+
+# Matched single frames of Color Match Blend, so changing only strength, blend mode or saturation
+# skips the match. Memory cap can be set with MACHINEPAINTING_MATCH_CACHE_MB (default 128 MB)
+MATCH_CACHE = LUTCache(int(os.environ.get("MACHINEPAINTING_MATCH_CACHE_MB", "128")) * 1024 * 1024)
+
+
+class ReferenceColorStats:
+    """
+    Analyze a reference image once: LAB mean/std, covariance and histograms per frame,
+    plus mean/std per tile of a local_grid x local_grid grid for local matching.
+    Connect the output to Color Match Blend or Color Adjust Blend in place of the
+    reference image. Stats are cached by image content, so an unchanged reference
+    is never converted or analyzed again.
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "reference_image": ("IMAGE",),
+            },
+            "optional": {
+                "reference_mask": ("MASK",),
+                "stats_resolution": (STATS_RESOLUTIONS, {"default": "exact"}),
+                "local_grid": ("INT", {"default": 8, "min": 2, "max": 32, "step": 1}),
+            }
+        }
+
+    RETURN_TYPES = ("COLOR_STATS",)
+    RETURN_NAMES = ("reference_stats",)
+    FUNCTION = "compute_stats"
+    CATEGORY = "MachinePaintingNodes/Color"
+
+    def compute_stats(self, reference_image, reference_mask=None, stats_resolution="exact", local_grid=8):
+        return (image_stats(reference_image, stats_resolution, reference_mask, local_grid),)
+
 
 class ColorMatchBlend:
     
-    BLEND_MODES = ["normal", "overlay", "multiply", "screen", "soft_light", 
-                   "hard_light", "color", "luminosity", "darken", "lighten"]
+    BLEND_MODES = BLEND_MODES
     
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "target_image": ("IMAGE",),
-                "reference_image": ("IMAGE",),
                 "strength": ("FLOAT", {"default": 0.75, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"}),
                 "enable_match_blend": ("BOOLEAN", {"default": True}),
                 "saturation": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 5.0, "display": "slider"}),
             },
             "optional": {
-                "match_method": (["statistical", "histogram", "reinhard"], {
+                "reference_image": ("IMAGE",),
+                "reference_stats": ("COLOR_STATS",),
+                "target_mask": ("MASK",),
+                "reference_mask": ("MASK",),
+                "match_method": (["statistical", "histogram", "reinhard", "linear", "local"], {
                     "default": "statistical"
                 }),
                 "blend_mode": (cls.BLEND_MODES, {"default": "normal"}),
@@ -36,6 +82,9 @@ class ColorMatchBlend:
                     "step": 0.05,
                     "display": "slider"
                 }),
+                "stats_resolution": (STATS_RESOLUTIONS, {"default": "exact"}),
+                "temporal_window": ("INT", {"default": 1, "min": 1, "max": 99, "step": 1}),
+                "local_grid": ("INT", {"default": 8, "min": 2, "max": 32, "step": 1}),
             }
         }
 
@@ -43,123 +92,191 @@ class ColorMatchBlend:
     FUNCTION = "apply_color_match_blend"
     CATEGORY = "MachinePaintingNodes/Color"
 
-    def apply_color_match_blend(self, target_image, reference_image, strength, 
-                                 enable_match_blend, saturation,
+    def apply_color_match_blend(self, target_image, strength, 
+                                 enable_match_blend, saturation, reference_image=None,
+                                 reference_stats=None,
                                  match_method="statistical", blend_mode="normal",
-                                 luminance_match=0.0, color_match=1.0):
+                                 luminance_match=0.0, color_match=1.0, stats_resolution="exact",
+                                 temporal_window=1, target_mask=None, reference_mask=None, local_grid=8):
+        
+        targets = image_view(target_image)[..., :3]
+        grid = local_grid if match_method == "local" else None
+        
+        # Reference stats are computed once per reference frame (and cached by content);
+        # a single reference is shared by every target frame
+        references = self.match_references(reference_image, reference_stats, stats_resolution,
+                                           reference_mask, grid) \
+            if enable_match_blend and strength > 0 else ()
+        
+        # Masks only weight the statistics; the transfer is still applied to the whole frame
+        target_masks = None
+        if references and target_mask is not None:
+            target_masks = mask_batch(target_mask, *targets.shape[:3])
         
-        target = (target_image[0].cpu().numpy() * 255).astype(np.uint8)
-        h, w = target.shape[:2]
-        target_bgr = cv2.cvtColor(target, cv2.COLOR_RGB2BGR)
+        # Video: smooth target statistics over neighbouring frames so the match does not flicker
+        target_stats = None
+        target_labs = None
+        if references and temporal_window > 1 and targets.shape[0] > 1:
+            # "exact" statistics need every pixel in LAB, so the batch is converted once
+            # and the same frames are matched from it
+            if stats_resolution == "exact":
+                target_labs = rgb_to_lab(targets)
+                stats_labs = target_labs
+            else:
+                stats_labs = rgb_to_lab(batch_proxy(targets, stats_resolution))
+            weights = batch_weights(target_masks, stats_resolution) if target_masks is not None else None
+            target_stats = self.temporal_target_stats(stats_labs, temporal_window,
+                                                      covariance=match_method == "linear",
+                                                      weights=weights, grid=grid)
+        
+        # Frames of a video batch are not matched again, so only a single frame is
+        # worth hashing and keeping for interactive tweaks
+        cache = targets.shape[0] == 1
+        results = (
+            self.match_blend_frame(target,
+                                   references[batch_index(i, len(references))] if references else None,
+                                   strength, saturation, match_method, blend_mode,
+                                   luminance_match, color_match, stats_resolution,
+                                   target_stats[i] if target_stats else None,
+                                   target_masks[i] if target_masks is not None else None,
+                                   local_grid,
+                                   target_labs[i] if target_labs is not None else None,
+                                   cache=cache)
+            for i, target in enumerate(targets)
+        )
+        result_tensor = frames_to_image(results, targets.shape[0])
+        return (result_tensor,)
+
+    @staticmethod
+    def match_references(reference_image, reference_stats, stats_resolution="exact", reference_mask=None,
+                         grid=None):
+        """Per-frame reference stats from a COLOR_STATS input, else from the (masked) reference image."""
+        if reference_stats is not None:
+            return reference_stats
+        if reference_image is not None:
+            return image_stats(reference_image, stats_resolution, reference_mask, grid)
+        print("[MachinePaintingNodes] Color match skipped: no reference image or reference stats connected")
+        return ()
+
+    @staticmethod
+    def temporal_target_stats(labs, window, covariance=False, weights=None, grid=None):
+        """
+        Per-frame LAB histograms (and moments) of a (B, H, W, 3) batch of float LAB stats
+        proxies, averaged over a moving window of frames. Moments are taken for the whole
+        batch at once; histograms are counted per frame, which keeps bincount cache-friendly.
+        With grid, only the per-tile moments of the local method are taken and averaged.
+        """
+        count = labs.shape[0]
+        if grid:
+            moments = np.stack([tile_moments(labs[i], grid, weights[i] if weights is not None else None)
+                                for i in range(count)])
+            tiles = tile_stats(moving_average(moments, window))
+            return [{key: value[i] for key, value in tiles.items()} for i in range(count)]
+        lab8 = to_lab8(labs)
+        hists = np.stack([lab_histograms(lab8[i], weights[i] if weights is not None else None)
+                          for i in range(count)])
+        return temporal_stats(hists, window,
+                              batch_moments(lab8, weights) if covariance else None)
 
-        if enable_match_blend and strength > 0:
-            reference = (reference_image[0].cpu().numpy() * 255).astype(np.uint8)
-            reference_bgr = cv2.cvtColor(reference, cv2.COLOR_RGB2BGR)
+    def match_blend_frame(self, target_rgb, reference, strength, saturation,
+                          match_method, blend_mode, luminance_match, color_match,
+                          stats_resolution="exact", target_stats=None, target_mask=None, local_grid=8,
+                          target_lab=None, cache=True):
+        """
+        Match, blend and saturate one float RGB frame. reference holds the reference LAB stats
+        and is None when matching is off. With cache, the matched frame is cached, so only
+        the blend, mix and saturation run again when nothing before them changed.
+        """
+        if reference is not None:
+            matched = self.matched_frame(target_rgb, reference, match_method, luminance_match, color_match,
+                                         stats_resolution, target_stats, target_mask, local_grid, target_lab,
+                                         cache)
             
-            # Resize reference to match target
-            if reference_bgr.shape[:2] != target_bgr.shape[:2]:
-                reference_bgr = cv2.resize(reference_bgr, (w, h))
+            # Blend mode and strength mix in one pass
+            result = blend(target_rgb, matched, blend_mode, strength)
+        else:
+            result = target_rgb
+
+        return self.apply_saturation(result, saturation)
+
+    def matched_frame(self, target_rgb, reference, match_method, luminance_match, color_match,
+                      stats_resolution="exact", target_stats=None, target_mask=None, local_grid=8,
+                      target_lab=None, cache=True):
+        """
+        Color match one float RGB frame to the reference stats. With cache, the result is kept
+        in MATCH_CACHE by the frame's content and everything the match depends on; without it
+        the frame is not hashed at all. The result is read-only.
+        target_lab is the frame already converted with rgb_to_lab, when the caller has it.
+        Only the statistics of the reference are used, so it is never resized to the target.
+        target_stats overrides the frame's own stats; otherwise they are taken over
+        target_mask when one is given.
+        The frame is converted to LAB once and back once; all steps stay in float32.
+        """
+        key = None
+        entry = None
+        if cache:
+            key = ("color_match", fingerprint(target_rgb), stats_fingerprint(reference),
+                   stats_fingerprint(target_stats) if target_stats is not None else None,
+                   fingerprint(target_mask) if target_mask is not None else None,
+                   match_method, luminance_match, color_match, stats_resolution,
+                   local_grid if match_method == "local" else None)
+            entry = MATCH_CACHE.get(key)
+        if entry is None:
+            if target_lab is None:
+                target_lab = rgb_to_lab(target_rgb)
+            if target_stats is None:
+                target_stats = self.frame_stats(target_lab, match_method, stats_resolution, target_mask,
+                                                local_grid)
             
             if match_method == "statistical":
-                matched = self.statistical_lab_match(target_bgr, reference_bgr, 
-                                                     luminance_match, color_match)
+                matched_lab = self.statistical_lab_match(target_lab, reference, target_stats,
+                                                         luminance_match, color_match)
             elif match_method == "histogram":
-                matched = self.histogram_lab_match(target_bgr, reference_bgr,
+                matched_lab = self.histogram_lab_match(target_lab, reference, target_stats,
+                                                       luminance_match, color_match)
+            elif match_method == "linear":
+                matched_lab = self.linear_lab_match(target_lab, reference, target_stats,
+                                                    luminance_match, color_match)
+            elif match_method == "local":
+                matched_lab = self.local_lab_match(target_lab, reference, target_stats,
                                                    luminance_match, color_match)
             else:  # reinhard
-                matched = self.reinhard_color_transfer(target_bgr, reference_bgr,
-                                                       luminance_match, color_match)
-            
-            # Apply blend mode
-            if blend_mode != "normal":
-                matched = self.apply_blend_mode(target_bgr, matched, blend_mode)
-            
-            result = cv2.addWeighted(target_bgr, 1 - strength, matched, strength, 0)
-        else:
-            result = target_bgr
+                matched_lab = self.reinhard_color_transfer(target_lab, reference, target_stats,
+                                                           luminance_match, color_match)
+            matched = lab_to_rgb(matched_lab)
+            matched.flags.writeable = False
+            entry = {"matched": matched}
+            if cache:
+                MATCH_CACHE.put(key, entry)
+        return entry["matched"]
 
-        result = self.apply_saturation(result, saturation)
-        
-        result_rgb = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
-        result_tensor = torch.from_numpy(result_rgb).float() / 255.0
-        result_tensor = result_tensor.unsqueeze(0)
-        return (result_tensor,)
+    @staticmethod
+    def frame_stats(target_lab, match_method, stats_resolution="exact", target_mask=None, local_grid=8):
+        """The statistics match_method needs from one float LAB frame, taken over target_mask if given."""
+        weights = stats_weights(target_mask, stats_resolution) if target_mask is not None else None
+        proxy = stats_proxy(target_lab, stats_resolution)
+        if match_method == "local":
+            return tile_stats(tile_moments(proxy, local_grid, weights))
+        return lab_stats(to_lab8(proxy), covariance=match_method == "linear", weights=weights)
 
-    def apply_blend_mode(self, bottom, top, mode):
-        bottom_f = bottom.astype(np.float32) / 255.0
-        top_f = top.astype(np.float32) / 255.0
-        
-        if mode == "multiply":
-            result = bottom_f * top_f
-        elif mode == "screen":
-            result = 1 - (1 - bottom_f) * (1 - top_f)
-        elif mode == "overlay":
-            result = np.where(bottom_f < 0.5, 
-                            2 * bottom_f * top_f, 
-                            1 - 2 * (1 - bottom_f) * (1 - top_f))
-        elif mode == "soft_light":
-            result = (1 - 2 * top_f) * (bottom_f ** 2) + 2 * top_f * bottom_f
-        elif mode == "hard_light":
-            result = np.where(top_f < 0.5,
-                            2 * bottom_f * top_f,
-                            1 - 2 * (1 - bottom_f) * (1 - top_f))
-        elif mode == "color":
-            result = self.blend_color(bottom_f, top_f)
-        elif mode == "luminosity":
-            result = self.blend_luminosity(bottom_f, top_f)
-        elif mode == "darken":
-            result = np.minimum(bottom_f, top_f)
-        elif mode == "lighten":
-            result = np.maximum(bottom_f, top_f)
-        else:
-            result = top_f
-        
-        return (np.clip(result, 0, 1) * 255).astype(np.uint8)
-
-    def blend_color(self, bottom, top):
-        # Keep luminosity of bottom, hue/sat of top
-        bottom_uint8 = (bottom * 255).astype(np.uint8)
-        top_uint8 = (top * 255).astype(np.uint8)
-        hsv_bottom = cv2.cvtColor(bottom_uint8, cv2.COLOR_BGR2HSV)
-        hsv_top = cv2.cvtColor(top_uint8, cv2.COLOR_BGR2HSV)
-        hsv_result = hsv_top.copy()
-        hsv_result[:, :, 2] = hsv_bottom[:, :, 2]
-        result = cv2.cvtColor(hsv_result, cv2.COLOR_HSV2BGR)
-        return result.astype(np.float32) / 255.0
-
-    def blend_luminosity(self, bottom, top):
-        # Keep hue/sat of bottom, luminosity of top
-        bottom_uint8 = (bottom * 255).astype(np.uint8)
-        top_uint8 = (top * 255).astype(np.uint8)
-        hsv_bottom = cv2.cvtColor(bottom_uint8, cv2.COLOR_BGR2HSV)
-        hsv_top = cv2.cvtColor(top_uint8, cv2.COLOR_BGR2HSV)
-        hsv_result = hsv_bottom.copy()
-        hsv_result[:, :, 2] = hsv_top[:, :, 2]
-        result = cv2.cvtColor(hsv_result, cv2.COLOR_HSV2BGR)
-        return result.astype(np.float32) / 255.0
-
-    def statistical_lab_match(self, target_bgr, reference_bgr, lum_strength, color_strength):
+    def statistical_lab_match(self, target_lab, reference, target, lum_strength, color_strength):
         """
         Statistical color matching in LAB space.
         Transfers mean and std of color channels without creating artifacts.
+        Takes and returns float LAB in 8-bit units; target and reference are their stats.
         """
-        target_lab = cv2.cvtColor(target_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        ref_lab = cv2.cvtColor(reference_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        
-        result_lab = target_lab.copy()
+        gain = np.ones(3, dtype=np.float32)
+        offset = np.zeros(3, dtype=np.float32)
         
         for i in range(3):
             strength = lum_strength if i == 0 else color_strength
             if strength <= 0:
                 continue
                 
-            t_mean = target_lab[:,:,i].mean()
-            t_std = max(target_lab[:,:,i].std(), 1.0)
-            r_mean = ref_lab[:,:,i].mean()
-            r_std = max(ref_lab[:,:,i].std(), 1.0)
-            
-            # Normalize, scale, and shift
-            normalized = (target_lab[:,:,i] - t_mean) / t_std
+            t_mean = float(target["mean"][i])
+            t_std = max(float(target["std"][i]), 1.0)
+            r_mean = float(reference["mean"][i])
+            r_std = max(float(reference["std"][i]), 1.0)
             
             # Blend the statistics based on strength
             new_std = t_std + strength * (r_std - t_std)
@@ -168,13 +285,17 @@ class ColorMatchBlend:
             # Limit std ratio to prevent extreme changes
             new_std = np.clip(new_std, t_std * 0.5, t_std * 2.0)
             
-            result_lab[:,:,i] = normalized * new_std + new_mean
+            # Normalize, scale, and shift: (x - t_mean) / t_std * new_std + new_mean
+            gain[i] = new_std / t_std
+            offset[i] = new_mean - t_mean * gain[i]
         
-        result_lab[:,:,0] = np.clip(result_lab[:,:,0], 0, 255)
-        result_lab[:,:,1] = np.clip(result_lab[:,:,1], 0, 255)
-        result_lab[:,:,2] = np.clip(result_lab[:,:,2], 0, 255)
-        
-        return cv2.cvtColor(result_lab.astype(np.uint8), cv2.COLOR_LAB2BGR)
+        return self.affine_lab(target_lab, np.diag(gain), offset)
+
+    @staticmethod
+    def affine_lab(lab, matrix, offset):
+        """Apply a 3x3 matrix and offset to every float LAB pixel in one pass, clipped to 0-255."""
+        result = transform_channels(lab, matrix, offset)
+        return np.clip(result, 0, 255, out=result)
 
     def gaussian_smooth_1d(self, data, sigma=1.0):
         """Simple 1D gaussian smoothing without scipy."""
@@ -189,117 +310,182 @@ class ColorMatchBlend:
         smoothed = np.convolve(padded, kernel, mode='valid')
         return smoothed
 
-    def histogram_lab_match(self, target_bgr, reference_bgr, lum_strength, color_strength):
+    def histogram_lab_match(self, target_lab, reference, target, lum_strength, color_strength):
         """
         Histogram matching with smoothing to prevent banding/patchiness.
         Uses interpolated LUT and applies gaussian smoothing to avoid discrete jumps.
+        Mapping, strength blend and clipping are folded into one 256-entry table per
+        channel, applied with linear interpolation in a single pass.
         """
-        target_lab = cv2.cvtColor(target_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        ref_lab = cv2.cvtColor(reference_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        
-        result_lab = target_lab.copy()
+        levels = np.arange(256, dtype=np.float32)
+        tables = np.empty((256, 3), dtype=np.float32)
         
         for i in range(3):
             strength = lum_strength if i == 0 else color_strength
             if strength <= 0:
+                tables[:, i] = levels
                 continue
             
-            target_channel = target_lab[:,:,i]
-            ref_channel = ref_lab[:,:,i]
-            
-            # Compute histograms
-            t_hist, _ = np.histogram(target_channel.flatten(), bins=256, range=(0, 256))
-            r_hist, _ = np.histogram(ref_channel.flatten(), bins=256, range=(0, 256))
-            
-            # Add small epsilon to avoid zero bins causing issues
-            t_hist = t_hist.astype(np.float64) + 1e-10
-            r_hist = r_hist.astype(np.float64) + 1e-10
-            
-            # Compute CDFs
-            t_cdf = np.cumsum(t_hist)
-            r_cdf = np.cumsum(r_hist)
-            
-            # Normalize CDFs
-            t_cdf = t_cdf / t_cdf[-1]
-            r_cdf = r_cdf / r_cdf[-1]
-            
-            # Create lookup table with interpolation for smoothness
-            lut = np.zeros(256, dtype=np.float32)
-            for j in range(256):
-                # Find where target CDF value falls in reference CDF
-                idx = np.searchsorted(r_cdf, t_cdf[j])
-                idx = min(idx, 255)
-                
-                # Linear interpolation for smoother mapping
-                if idx > 0 and idx < 255:
-                    t_val = t_cdf[j]
-                    r_low = r_cdf[idx - 1]
-                    r_high = r_cdf[idx]
-                    if r_high - r_low > 1e-10:
-                        frac = (t_val - r_low) / (r_high - r_low)
-                        lut[j] = (idx - 1) + frac
-                    else:
-                        lut[j] = idx
-                else:
-                    lut[j] = idx
-            
-            # Smooth the LUT to reduce banding
+            # Smooth the inverse-CDF mapping to reduce banding
+            lut = self.cdf_match_lut(target["cdf"][i], reference["cdf"][i])
             lut = self.gaussian_smooth_1d(lut, sigma=1.5)
             lut = np.clip(lut, 0, 255)
             
-            # Apply the smooth lookup using interpolation
-            matched = np.interp(target_channel.flatten(), 
-                               np.arange(256), lut).reshape(target_channel.shape)
-            
             # Blend with original
-            result_lab[:,:,i] = target_channel * (1 - strength) + matched * strength
+            tables[:, i] = levels * (1 - strength) + lut * strength
         
-        result_lab[:,:,0] = np.clip(result_lab[:,:,0], 0, 255)
-        result_lab[:,:,1] = np.clip(result_lab[:,:,1], 0, 255)
-        result_lab[:,:,2] = np.clip(result_lab[:,:,2], 0, 255)
+        np.clip(tables, 0, 255, out=tables)
+        return self.interp_tables(target_lab, tables)
+
+    @staticmethod
+    def interp_tables(lab, tables):
+        """Map each LAB channel through its column of a (256, 3) table, interpolating linearly."""
+        # Base and slope per level, channels stacked 256 apart, packed so one 8-byte gather fetches both
+        packed = np.zeros((3, 256, 2), dtype=np.float32)
+        packed[:, :, 0] = tables.T
+        packed[:, :255, 1] = np.diff(tables, axis=0).T
+        packed = packed.view(np.uint64).reshape(-1)
+        
+        pos = np.clip(lab, 0, 255)
+        pos = scale_channels(pos, (1.0, 1.0, 1.0), (0.0, 256.0, 512.0))
+        seg = pos.astype(np.int32)
+        pos -= seg
         
-        return cv2.cvtColor(result_lab.astype(np.uint8), cv2.COLOR_LAB2BGR)
+        pairs = np.take(packed, seg).view(np.float32)
+        result = pairs[..., 1::2].reshape(lab.shape) * pos
+        result += pairs[..., 0::2].reshape(lab.shape)
+        return result
 
-    def reinhard_color_transfer(self, target_bgr, reference_bgr, lum_strength, color_strength):
+    @staticmethod
+    def cdf_match_lut(t_cdf, r_cdf):
         """
-        Classic Reinhard color transfer with per-channel strength control.
+        Map each of the 256 target levels to where its CDF value falls in the reference CDF,
+        interpolating between reference levels for a smooth mapping.
         """
-        target_lab = cv2.cvtColor(target_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        ref_lab = cv2.cvtColor(reference_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
+        idx = np.minimum(np.searchsorted(r_cdf, t_cdf), 255)
+        r_low = r_cdf[np.maximum(idx - 1, 0)]
+        r_high = r_cdf[idx]
+        step = r_high - r_low
+        inner = (idx > 0) & (idx < 255) & (step > 1e-10)
         
-        result_lab = target_lab.copy()
+        frac = np.zeros(256)
+        np.divide(t_cdf - r_low, step, out=frac, where=inner)
+        lut = np.where(inner, (idx - 1) + frac, idx)
+        return lut.astype(np.float32)
+
+    def reinhard_color_transfer(self, target_lab, reference, target, lum_strength, color_strength):
+        """
+        Classic Reinhard color transfer with per-channel strength control.
+        Takes and returns float LAB in 8-bit units.
+        """
+        gain = np.ones(3, dtype=np.float32)
+        offset = np.zeros(3, dtype=np.float32)
         
         for i in range(3):
             strength = lum_strength if i == 0 else color_strength
             if strength <= 0:
                 continue
                 
-            t_mean = target_lab[:,:,i].mean()
-            t_std = max(target_lab[:,:,i].std(), 1.0)
-            r_mean = ref_lab[:,:,i].mean()
-            r_std = max(ref_lab[:,:,i].std(), 1.0)
+            t_mean = float(target["mean"][i])
+            t_std = max(float(target["std"][i]), 1.0)
+            r_mean = float(reference["mean"][i])
+            r_std = max(float(reference["std"][i]), 1.0)
             
             # Classic Reinhard: normalize by target stats, scale by reference stats
             std_ratio = np.clip(r_std / t_std, 0.3, 3.0)
             
-            transferred = (target_lab[:,:,i] - t_mean) * std_ratio + r_mean
-            
-            # Blend based on strength
-            result_lab[:,:,i] = target_lab[:,:,i] * (1 - strength) + transferred * strength
+            # Blend (x - t_mean) * std_ratio + r_mean with the original based on strength
+            gain[i] = (1 - strength) + strength * std_ratio
+            offset[i] = strength * (r_mean - t_mean * std_ratio)
+        
+        return self.affine_lab(target_lab, np.diag(gain), offset)
+
+    def linear_lab_match(self, target_lab, reference, target, lum_strength, color_strength):
+        """
+        Monge-Kantorovich linear color transfer in LAB space.
+        The closed-form affine map that carries the target's mean and 3x3 covariance onto
+        the reference's, so cross-channel correlations transfer too. Applying it is one
+        3x3 matrix pass. Takes and returns float LAB in 8-bit units.
+        """
+        # Regularize like the std floor of the per-channel methods
+        t_cov = target["cov"] + np.eye(3)
+        r_cov = reference["cov"] + np.eye(3)
         
-        result_lab[:,:,0] = np.clip(result_lab[:,:,0], 0, 255)
-        result_lab[:,:,1] = np.clip(result_lab[:,:,1], 0, 255)
-        result_lab[:,:,2] = np.clip(result_lab[:,:,2], 0, 255)
+        # T = Ct^-1/2 (Ct^1/2 Cr Ct^1/2)^1/2 Ct^-1/2
+        t_sqrt = self.sqrtm_spd(t_cov)
+        t_inv_sqrt = np.linalg.inv(t_sqrt)
+        transfer = t_inv_sqrt @ self.sqrtm_spd(t_sqrt @ r_cov @ t_sqrt) @ t_inv_sqrt
         
-        return cv2.cvtColor(result_lab.astype(np.uint8), cv2.COLOR_LAB2BGR)
+        # Limit the gain along every axis to prevent extreme changes
+        w, v = np.linalg.eigh((transfer + transfer.T) / 2)
+        transfer = (v * np.clip(w, 0.3, 3.0)) @ v.T
+        
+        # Blend x -> T (x - t_mean) + r_mean with the original per channel
+        strength = np.diag([max(lum_strength, 0.0), max(color_strength, 0.0), max(color_strength, 0.0)])
+        matrix = np.eye(3) + strength @ (transfer - np.eye(3))
+        offset = strength @ (reference["mean"] - transfer @ target["mean"])
+        return self.affine_lab(target_lab, matrix, offset)
+
+    def local_lab_match(self, target_lab, reference, target, lum_strength, color_strength):
+        """
+        Statistical matching per tile of a coarse grid, for frames whose lighting varies.
+        Each target tile is carried onto the same tile of the reference; the per-tile gain
+        and offset are smoothed across tiles and upsampled with a guided filter on the
+        target's lightness, so the transfer follows edges instead of tile borders.
+        target holds per-tile stats; a reference without them is matched as a whole.
+        Takes and returns float LAB in 8-bit units.
+        """
+        t_mean = target["tile_mean"]
+        t_std = np.maximum(target["tile_std"], 1.0)
+        grid = t_mean.shape[:2]
+        r_mean, r_std = self.reference_tiles(reference, grid)
+        r_std = np.maximum(r_std, 1.0)
+        
+        # Same per-channel transfer as statistical_lab_match, for every tile at once
+        strength = np.array([max(lum_strength, 0.0), max(color_strength, 0.0), max(color_strength, 0.0)])
+        new_std = np.clip(t_std + strength * (r_std - t_std), t_std * 0.5, t_std * 2.0)
+        new_mean = t_mean + strength * (r_mean - t_mean)
+        gain = new_std / t_std
+        offset = new_mean - t_mean * gain
+        
+        # Smooth the transfer across neighbouring tiles to avoid visible tile steps
+        gain = cv2.GaussianBlur(gain.astype(np.float32), (3, 3), 0)
+        offset = cv2.GaussianBlur(offset.astype(np.float32), (3, 3), 0)
+        
+        guide = np.ascontiguousarray(target_lab[..., 0]) * np.float32(1.0 / 255.0)
+        radius = max(2, 128 // max(grid))
+        result = guided_upsample(gain, guide, radius)
+        result *= target_lab
+        result += guided_upsample(offset, guide, radius)
+        return np.clip(result, 0, 255, out=result)
+
+    @staticmethod
+    def reference_tiles(reference, grid):
+        """Per-tile reference mean and std resampled to the target's grid, or its global stats."""
+        if "tile_mean" not in reference:
+            return (np.broadcast_to(reference["mean"], grid + (3,)),
+                    np.broadcast_to(reference["std"], grid + (3,)))
+        tiles = []
+        for key in ("tile_mean", "tile_std"):
+            value = reference[key]
+            if value.shape[:2] != grid:
+                value = cv2.resize(value, grid[::-1], interpolation=cv2.INTER_LINEAR)
+            tiles.append(value)
+        return tiles
+
+    @staticmethod
+    def sqrtm_spd(matrix):
+        """Square root of a symmetric positive definite 3x3 matrix."""
+        w, v = np.linalg.eigh(matrix)
+        return (v * np.sqrt(np.maximum(w, 0.0))) @ v.T
 
-    def apply_saturation(self, bgr, saturation):
+    def apply_saturation(self, rgb, saturation):
         if saturation == 0:
-            return bgr
-        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV).astype(np.float32)
+            return rgb
+        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
         factor = 1 + saturation / 100.0
-        hsv[:, :, 1] = np.clip(hsv[:, :, 1] * factor, 0, 255)
-        return cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+        hsv[:, :, 1] = np.clip(hsv[:, :, 1] * factor, 0, 1)
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
 
 
 class ColorAdjustBlend:
@@ -309,8 +495,7 @@ class ColorAdjustBlend:
     Works standalone as simple color adjust if no reference provided.
     """
     
-    BLEND_MODES = ["normal", "overlay", "multiply", "screen", "soft_light", 
-                   "hard_light", "color", "luminosity", "darken", "lighten"]
+    BLEND_MODES = BLEND_MODES
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -321,6 +506,9 @@ class ColorAdjustBlend:
             "optional": {
                 # Color reference (optional)
                 "color_reference": ("IMAGE",),
+                "color_reference_stats": ("COLOR_STATS",),
+                "image_mask": ("MASK",),
+                "color_reference_mask": ("MASK",),
                 "reference_strength": ("FLOAT", {"default": 0.75, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"}),
                 "blend_mode": (cls.BLEND_MODES, {"default": "color"}),
                 # RGB adjustments (post-process)
@@ -333,6 +521,8 @@ class ColorAdjustBlend:
                 "r_highlights": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 5.0, "display": "slider"}),
                 "g_highlights": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 5.0, "display": "slider"}),
                 "b_highlights": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 5.0, "display": "slider"}),
+                # Appended after the existing widgets so saved workflows keep their values
+                "stats_resolution": (STATS_RESOLUTIONS, {"default": "exact"}),
             }
         }
 
@@ -344,123 +534,89 @@ class ColorAdjustBlend:
                                color_reference=None, reference_strength=0.75, blend_mode="color",
                                r_shadows=0.0, g_shadows=0.0, b_shadows=0.0,
                                r_midtones=0.0, g_midtones=0.0, b_midtones=0.0,
-                               r_highlights=0.0, g_highlights=0.0, b_highlights=0.0):
+                               r_highlights=0.0, g_highlights=0.0, b_highlights=0.0,
+                               color_reference_stats=None, stats_resolution="exact",
+                               image_mask=None, color_reference_mask=None):
+        
+        images = image_view(image)[..., :3]
+        
+        # Reference stats are computed once per reference frame (and cached by content);
+        # a single reference is shared by every frame
+        references = ()
+        if reference_strength > 0:
+            if color_reference_stats is not None:
+                references = color_reference_stats
+            elif color_reference is not None:
+                references = image_stats(color_reference, stats_resolution, color_reference_mask)
+        
+        # Masks only weight the statistics; the match is still applied to the whole frame
+        image_masks = None
+        if references and image_mask is not None:
+            image_masks = mask_batch(image_mask, *images.shape[:3])
         
-        img = (image[0].cpu().numpy() * 255).astype(np.uint8)
-        h, w = img.shape[:2]
-        img_bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        results = (
+            self.adjust_blend_frame(img,
+                                    references[batch_index(i, len(references))] if references else None,
+                                    reference_strength, blend_mode, stats_resolution,
+                                    r_shadows, g_shadows, b_shadows,
+                                    r_midtones, g_midtones, b_midtones,
+                                    r_highlights, g_highlights, b_highlights,
+                                    image_masks[i] if image_masks is not None else None)
+            for i, img in enumerate(images)
+        )
+        result_tensor = frames_to_image(results, images.shape[0])
+        return (result_tensor,)
 
+    def adjust_blend_frame(self, img_rgb, reference, reference_strength, blend_mode, stats_resolution,
+                           r_shadows, g_shadows, b_shadows,
+                           r_midtones, g_midtones, b_midtones,
+                           r_highlights, g_highlights, b_highlights, image_mask=None):
+        """
+        Color match (when reference stats are given) and color balance one float RGB frame.
+        The frame's own statistics are taken over image_mask when one is given.
+        """
         # Step 1: If color reference provided, color match then blend
-        if color_reference is not None and reference_strength > 0:
-            ref = (color_reference[0].cpu().numpy() * 255).astype(np.uint8)
-            ref_bgr = cv2.cvtColor(ref, cv2.COLOR_RGB2BGR)
-            if ref_bgr.shape[:2] != (h, w):
-                ref_bgr = cv2.resize(ref_bgr, (w, h))
-            
+        if reference is not None:
             # Color match the reference to the image (statistical LAB matching)
-            matched = self.statistical_lab_match(img_bgr, ref_bgr)
-            
-            # Apply blend mode to the matched result
-            if blend_mode != "normal":
-                blended = self.apply_blend_mode(img_bgr, matched, blend_mode)
-            else:
-                blended = matched
+            target_lab = rgb_to_lab(img_rgb)
+            weights = stats_weights(image_mask, stats_resolution) if image_mask is not None else None
+            target = lab_stats(to_lab8(stats_proxy(target_lab, stats_resolution)), covariance=False,
+                               weights=weights)
+            matched = lab_to_rgb(self.statistical_lab_match(target_lab, reference, target))
             
-            # Blend with original based on strength
-            img_bgr = cv2.addWeighted(img_bgr, 1 - reference_strength, blended, reference_strength, 0)
+            # Apply blend mode to the matched result and mix with the original by strength
+            img_rgb = blend(img_rgb, matched, blend_mode, reference_strength)
 
         # Step 2: Apply RGB color balance adjustments (post-process)
-        img_bgr = self.photoshop_color_balance(img_bgr, 
-                                             r_shadows, g_shadows, b_shadows,
-                                             r_midtones, g_midtones, b_midtones,
-                                             r_highlights, g_highlights, b_highlights)
-
-        result_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        result_tensor = torch.from_numpy(result_rgb).float() / 255.0
-        result_tensor = result_tensor.unsqueeze(0)
-        return (result_tensor,)
+        return self.color_balance(img_rgb,
+                                  r_shadows, g_shadows, b_shadows,
+                                  r_midtones, g_midtones, b_midtones,
+                                  r_highlights, g_highlights, b_highlights)
 
-    def statistical_lab_match(self, target_bgr, reference_bgr):
-        """Match colors from reference to target using LAB color space."""
-        target_lab = cv2.cvtColor(target_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        ref_lab = cv2.cvtColor(reference_bgr, cv2.COLOR_BGR2LAB).astype(np.float32)
-        
-        result_lab = target_lab.copy()
+    def statistical_lab_match(self, target_lab, reference, target):
+        """Match colors from reference stats to target using LAB color space (float, 8-bit units)."""
+        gain = np.ones(3, dtype=np.float32)
+        offset = np.zeros(3, dtype=np.float32)
         
         for i in range(3):
-            t_mean = target_lab[:,:,i].mean()
-            t_std = max(target_lab[:,:,i].std(), 1.0)
-            r_mean = ref_lab[:,:,i].mean()
-            r_std = max(ref_lab[:,:,i].std(), 1.0)
+            t_mean = float(target["mean"][i])
+            t_std = max(float(target["std"][i]), 1.0)
+            r_mean = float(reference["mean"][i])
+            r_std = max(float(reference["std"][i]), 1.0)
             
-            # Normalize, scale, and shift
-            normalized = (target_lab[:,:,i] - t_mean) / t_std
+            # Normalize, scale, and shift: (x - t_mean) / t_std * new_std + r_mean
             new_std = np.clip(r_std, t_std * 0.5, t_std * 2.0)
-            result_lab[:,:,i] = normalized * new_std + r_mean
+            gain[i] = new_std / t_std
+            offset[i] = r_mean - t_mean * gain[i]
         
-        result_lab = np.clip(result_lab, 0, 255).astype(np.uint8)
-        return cv2.cvtColor(result_lab, cv2.COLOR_LAB2BGR)
+        return ColorMatchBlend.affine_lab(target_lab, np.diag(gain), offset)
 
-    def apply_blend_mode(self, bottom, top, mode):
-        bottom_f = bottom.astype(np.float32) / 255.0
-        top_f = top.astype(np.float32) / 255.0
-        
-        if mode == "normal":
-            result = top_f
-        elif mode == "multiply":
-            result = bottom_f * top_f
-        elif mode == "screen":
-            result = 1 - (1 - bottom_f) * (1 - top_f)
-        elif mode == "overlay":
-            result = np.where(bottom_f < 0.5, 
-                            2 * bottom_f * top_f, 
-                            1 - 2 * (1 - bottom_f) * (1 - top_f))
-        elif mode == "soft_light":
-            result = (1 - 2 * top_f) * (bottom_f ** 2) + 2 * top_f * bottom_f
-        elif mode == "hard_light":
-            result = np.where(top_f < 0.5,
-                            2 * bottom_f * top_f,
-                            1 - 2 * (1 - bottom_f) * (1 - top_f))
-        elif mode == "color":
-            result = self.blend_color(bottom_f, top_f)
-        elif mode == "luminosity":
-            result = self.blend_luminosity(bottom_f, top_f)
-        elif mode == "darken":
-            result = np.minimum(bottom_f, top_f)
-        elif mode == "lighten":
-            result = np.maximum(bottom_f, top_f)
-        else:
-            result = top_f
-        
-        return (np.clip(result, 0, 1) * 255).astype(np.uint8)
-
-    def blend_color(self, bottom, top):
-        bottom_uint8 = (bottom * 255).astype(np.uint8)
-        top_uint8 = (top * 255).astype(np.uint8)
-        hsv_bottom = cv2.cvtColor(bottom_uint8, cv2.COLOR_BGR2HSV)
-        hsv_top = cv2.cvtColor(top_uint8, cv2.COLOR_BGR2HSV)
-        hsv_result = hsv_top.copy()
-        hsv_result[:, :, 2] = hsv_bottom[:, :, 2]
-        result = cv2.cvtColor(hsv_result, cv2.COLOR_HSV2BGR)
-        return result.astype(np.float32) / 255.0
-
-    def blend_luminosity(self, bottom, top):
-        bottom_uint8 = (bottom * 255).astype(np.uint8)
-        top_uint8 = (top * 255).astype(np.uint8)
-        hsv_bottom = cv2.cvtColor(bottom_uint8, cv2.COLOR_BGR2HSV)
-        hsv_top = cv2.cvtColor(top_uint8, cv2.COLOR_BGR2HSV)
-        hsv_result = hsv_bottom.copy()
-        hsv_result[:, :, 2] = hsv_top[:, :, 2]
-        result = cv2.cvtColor(hsv_result, cv2.COLOR_HSV2BGR)
-        return result.astype(np.float32) / 255.0
-
-    def photoshop_color_balance(self, bgr, r_shadows, g_shadows, b_shadows,
-                              r_midtones, g_midtones, b_midtones,
-                              r_highlights, g_highlights, b_highlights):
-        b, g, r = cv2.split(bgr)
-        b_f = b.astype(np.float32) / 255.0
-        g_f = g.astype(np.float32) / 255.0
-        r_f = r.astype(np.float32) / 255.0
+    @staticmethod
+    def color_balance(rgb_f, r_shadows, g_shadows, b_shadows,
+                      r_midtones, g_midtones, b_midtones,
+                      r_highlights, g_highlights, b_highlights):
+        """Shadow/midtone/highlight color balance on float RGB (..., 3) values in 0-1."""
+        r_f, g_f, b_f = rgb_f[..., 0], rgb_f[..., 1], rgb_f[..., 2]
         
         luminance = 0.299 * r_f + 0.587 * g_f + 0.114 * b_f
         
@@ -481,13 +637,8 @@ class ColorAdjustBlend:
             )
             return np.clip(adjusted, 0, 1)
         
-        r_f = apply_adjustment(r_f, r_shadows, r_midtones, r_highlights)
-        g_f = apply_adjustment(g_f, g_shadows, g_midtones, g_highlights)
-        b_f = apply_adjustment(b_f, b_shadows, b_midtones, b_highlights)
-        
-        result_bgr = cv2.merge([
-            (b_f * 255).astype(np.uint8),
-            (g_f * 255).astype(np.uint8),
-            (r_f * 255).astype(np.uint8)
-        ])
-        return result_bgr
+        result = np.empty(rgb_f.shape[:-1] + (3,), dtype=np.float32)
+        result[..., 0] = apply_adjustment(r_f, r_shadows, r_midtones, r_highlights)
+        result[..., 1] = apply_adjustment(g_f, g_shadows, g_midtones, g_highlights)
+        result[..., 2] = apply_adjustment(b_f, b_shadows, b_midtones, b_highlights)
+        return result
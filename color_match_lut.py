@@ -0,0 +1,102 @@
+import numpy as np
+from .image_utils import image_view, image_tensor, mask_batch, batch_index
+from .lut_apply import LUTApply, LUT_CACHE
+from .color_stats import STATS_RESOLUTIONS, rgb_to_lab, stats_fingerprint
+from .color_blend import ColorMatchBlend
+
+
+class ColorMatchLUT(LUTApply):
+    """
+    Bake a color match into one 3D LUT.
+    The transfer is measured on one key frame of the target against the reference, then the
+    whole Color Match Blend chain (match -> blend mode -> strength -> saturation) is run once
+    on a LUT lattice. The LUT grades the batch here, can be passed on to LUT Apply, or
+    exported as a .cube file to grade the rest of a sequence with a single lookup per pixel.
+    """
+
+    LUT_SIZES = ["33", "65"]
+    # The local method varies over the frame, so it cannot be expressed as a LUT
+    MATCH_METHODS = ["statistical", "histogram", "reinhard", "linear"]
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "target_image": ("IMAGE",),
+                "lut_size": (cls.LUT_SIZES, {"default": "33"}),
+            },
+            "optional": {
+                "reference_image": ("IMAGE",),
+                "reference_stats": ("COLOR_STATS",),
+                "target_mask": ("MASK",),
+                "reference_mask": ("MASK",),
+                "key_frame": ("INT", {"default": 0, "min": 0, "max": 99999, "step": 1}),
+                "match_method": (cls.MATCH_METHODS, {"default": "statistical"}),
+                "blend_mode": (ColorMatchBlend.BLEND_MODES, {"default": "normal"}),
+                "strength": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"}),
+                "luminance_match": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"}),
+                "color_match": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"}),
+                "saturation": ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 5.0, "display": "slider"}),
+                "stats_resolution": (STATS_RESOLUTIONS, {"default": "exact"}),
+                "interpolation": (cls.INTERPOLATION_MODES, {"default": "trilinear"}),
+                "export_cube": ("BOOLEAN", {"default": False}),
+                "cube_name": ("STRING", {"default": "color_match"}),
+                "overwrite_cube": ("BOOLEAN", {"default": False}),
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE", "LUT")
+    RETURN_NAMES = ("image", "lut")
+    FUNCTION = "bake_color_match"
+    CATEGORY = "MachinePaintingNodes/Color"
+
+    def bake_color_match(self, target_image, lut_size="33", reference_image=None, reference_stats=None,
+                         target_mask=None, reference_mask=None, key_frame=0,
+                         match_method="statistical", blend_mode="normal", strength=1.0,
+                         luminance_match=0.0, color_match=1.0, saturation=0.0, stats_resolution="exact",
+                         interpolation="trilinear", export_cube=False, cube_name="color_match",
+                         overwrite_cube=False):
+        matcher = ColorMatchBlend()
+        references = matcher.match_references(reference_image, reference_stats, stats_resolution,
+                                              reference_mask)
+        if not references:
+            return (target_image, None)
+
+        targets = image_view(target_image)[..., :3]
+        index = min(key_frame, targets.shape[0] - 1)
+        reference = references[batch_index(index, len(references))]
+        mask = mask_batch(target_mask, *targets.shape[:3])[index] if target_mask is not None else None
+        target_stats = matcher.frame_stats(rgb_to_lab(targets[index]), match_method, stats_resolution, mask)
+
+        lut_size = int(lut_size)
+        key = ("color_match_lut", stats_fingerprint(reference), stats_fingerprint(target_stats),
+               match_method, blend_mode, strength, luminance_match, color_match, saturation, lut_size)
+        entry = LUT_CACHE.get(key)
+        if entry is None:
+            lut = self.bake_match(matcher, reference, target_stats, lut_size, match_method, blend_mode,
+                                  strength, luminance_match, color_match, saturation)
+            lut.flags.writeable = False
+            entry = {"key": key, "lut": lut, "size": lut_size}
+            LUT_CACHE.put(key, entry)
+
+        if export_cube:
+            self.export_lut(entry, cube_name, "color_match", overwrite_cube)
+
+        result = self.apply_3d_lut(targets, entry["lut"], entry["size"], interpolation)
+        np.clip(result, 0, 1, out=result)
+
+        return (image_tensor(result), entry)
+
+    def bake_match(self, matcher, reference, target_stats, lut_size, match_method, blend_mode,
+                   strength, luminance_match, color_match, saturation):
+        """
+        Run the match chain on an identity lattice laid out as a (size * size, size) frame.
+        Every step is per pixel once the statistics are fixed, so the lattice is graded
+        exactly like a frame with the key frame's statistics.
+        """
+        lattice = self.identity_lattice(lut_size)
+        frame = lattice.reshape(lut_size * lut_size, lut_size, 3)
+        graded = matcher.match_blend_frame(frame, reference, strength, saturation, match_method, blend_mode,
+                                           luminance_match, color_match, target_stats=target_stats,
+                                           cache=False)
+        return np.clip(graded, 0, 1).reshape(lattice.shape).astype(np.float32)
@@ -0,0 +1,285 @@
+import os
+import hashlib
+import numpy as np
+import cv2
+from .image_utils import image_view, mask_batch, scale_channels
+from .lut_apply import LUTCache
+
+# Pixels converted to float64 at a time while accumulating channel sums
+STATS_CHUNK = 1 << 18
+# Longest side of the pixel grid statistics are sampled on; "exact" uses every pixel
+STATS_RESOLUTIONS = ["exact", "2048", "1024", "512", "256"]
+# Longest side of the pixel grid per-tile statistics are sampled on
+TILE_STATS_RESOLUTION = "512"
+# OpenCV float LAB (L 0-100, a/b around 0) to 8-bit units: L * 255 / 100, a + 128, b + 128
+LAB_SCALE = np.array([255.0 / 100.0, 1.0, 1.0], dtype=np.float32)
+LAB_OFFSET = np.array([0.0, 128.0, 128.0], dtype=np.float32)
+
+# Per-frame reference statistics, kept apart from the LUT cache so they never evict LUTs.
+# Memory cap can be set with MACHINEPAINTING_STATS_CACHE_MB (default 64 MB)
+STATS_CACHE = LUTCache(int(os.environ.get("MACHINEPAINTING_STATS_CACHE_MB", "64")) * 1024 * 1024)
+
+
+def rgb_to_lab(rgb):
+    """
+    Float RGB (0-1) to float32 LAB in 8-bit units: L scaled to 0-255, a and b offset by 128.
+    These are the units OpenCV uses for 8-bit LAB, without the quantization.
+    Accepts a frame or a whole (B, H, W, C) batch, which is converted in one call.
+    """
+    rgb = np.ascontiguousarray(rgb[..., :3], dtype=np.float32)
+    lab = cv2.cvtColor(rgb.reshape((-1,) + rgb.shape[-2:]), cv2.COLOR_RGB2LAB).reshape(rgb.shape)
+    return scale_channels(lab, LAB_SCALE, LAB_OFFSET)
+
+
+def lab_to_rgb(lab):
+    """Inverse of rgb_to_lab, clipped to 0-1."""
+    rgb = cv2.cvtColor(scale_channels(lab, 1.0 / LAB_SCALE, -LAB_OFFSET / LAB_SCALE), cv2.COLOR_LAB2RGB)
+    return np.clip(rgb, 0, 1, out=rgb)
+
+
+def to_lab8(lab):
+    """Round float LAB (8-bit units) to uint8 for histogram statistics."""
+    rounded = np.add(lab, 0.5, dtype=np.float32)
+    np.clip(rounded, 0, 255, out=rounded)
+    return rounded.astype(np.uint8)
+
+
+def fingerprint(frame):
+    """Content hash of one float frame, used to key its cached statistics."""
+    sha1 = hashlib.sha1(np.ascontiguousarray(frame).data)
+    sha1.update(str(frame.shape).encode())
+    return sha1.hexdigest()
+
+
+def stats_fingerprint(stats):
+    """Content hash of a stats dict, so stage caches can tell references apart."""
+    sha1 = hashlib.sha1()
+    for key in sorted(stats):
+        sha1.update(key.encode())
+        sha1.update(np.ascontiguousarray(stats[key]).data)
+    return sha1.hexdigest()
+
+
+def stats_proxy(frame, resolution="exact"):
+    """
+    Strided view of a frame for computing statistics, with its longer side brought
+    down to resolution. Striding samples pixels without averaging them, so
+    histograms keep their shape.
+    """
+    stride = proxy_stride(frame.shape[:2], resolution)
+    return frame[::stride, ::stride] if stride > 1 else frame
+
+
+def batch_proxy(frames, resolution="exact"):
+    """stats_proxy for every frame of a (B, H, W, ...) batch at once."""
+    stride = proxy_stride(frames.shape[1:3], resolution)
+    return frames[:, ::stride, ::stride] if stride > 1 else frames
+
+
+def proxy_stride(size, resolution="exact"):
+    """Pixel stride that brings the longer side of size down to resolution."""
+    if resolution == "exact":
+        return 1
+    return -(-max(size) // int(resolution))
+
+
+def stats_weights(mask, resolution="exact"):
+    """
+    Per-pixel statistics weights from one MASK frame, sampled like stats_proxy.
+    Returns None (unweighted statistics) when the mask selects no pixels.
+    """
+    weights = np.clip(stats_proxy(mask, resolution), 0, None)
+    if not weights.any():
+        print("[MachinePaintingNodes] Color match mask is empty, using the whole frame for statistics")
+        return None
+    return weights
+
+
+def batch_weights(masks, resolution="exact"):
+    """
+    stats_weights for a (B, H, W) batch of MASK frames. Frames whose mask selects no
+    pixels are weighted uniformly, which gives the same statistics as no mask.
+    """
+    weights = np.clip(batch_proxy(masks, resolution), 0, None)
+    empty = ~weights.any(axis=(1, 2))
+    if empty.any():
+        print("[MachinePaintingNodes] Color match mask is empty, using the whole frame for statistics")
+        weights[empty] = 1.0
+    return weights
+
+
+def lab_histograms(lab, weights=None):
+    """
+    256-bin histograms of the three channels of an 8-bit LAB frame, shape (3, 256).
+    With weights (a mask of the frame's size) every pixel counts by its weight.
+    """
+    pixels = lab.reshape(-1, 3)
+    if weights is not None:
+        weights = weights.reshape(-1).astype(np.float64)
+    return np.stack([
+        np.bincount(pixels[:, i], weights=weights, minlength=256) for i in range(3)
+    ]).astype(np.float64)
+
+
+def histogram_stats(hist):
+    """
+    Mean, std and normalized CDF of (..., 3, 256) histograms, in 8-bit LAB units.
+    Works on any number of leading axes, so a whole batch is derived at once.
+    """
+    levels = np.arange(256, dtype=np.float64)
+    count = hist.sum(axis=-1)
+    mean = hist @ levels / count
+    var = hist @ (levels * levels) / count - mean * mean
+    # Small epsilon keeps empty bins from producing flat CDF steps
+    cdf = np.cumsum(hist + 1e-10, axis=-1)
+    cdf /= cdf[..., -1:]
+    return {
+        "mean": mean,
+        "std": np.sqrt(np.maximum(var, 0.0)),
+        "hist": hist,
+        "cdf": cdf,
+    }
+
+
+def lab_stats(lab, covariance=True, weights=None):
+    """
+    Per-channel statistics of an 8-bit LAB frame, in 8-bit LAB units (0-255):
+    256-bin histograms, normalized CDFs, mean and std, plus the 3x3 covariance.
+    Mean and std come straight from the histograms; all sums are exact for uint8 values.
+    weights restricts the statistics to a (soft) mask region.
+    """
+    stats = histogram_stats(lab_histograms(lab, weights))
+    if covariance:
+        stats["cov"] = lab_moments(lab, weights) - np.outer(stats["mean"], stats["mean"])
+    return stats
+
+
+def lab_moments(lab, weights=None):
+    """Second moments E[x x^T] of the (optionally weighted) LAB pixels as a 3x3 matrix."""
+    pixels = lab.reshape(-1, 3)
+    if weights is not None:
+        weights = weights.reshape(-1)
+    gram = np.zeros((3, 3))
+    for start in range(0, pixels.shape[0], STATS_CHUNK):
+        chunk = pixels[start:start + STATS_CHUNK].astype(np.float64)
+        if weights is None:
+            gram += chunk.T @ chunk
+        else:
+            gram += (chunk * weights[start:start + STATS_CHUNK, np.newaxis]).T @ chunk
+    return gram / (pixels.shape[0] if weights is None else weights.sum(dtype=np.float64))
+
+
+def tile_moments(lab, grid, weights=None):
+    """
+    First and second moments of float LAB over a grid x grid tiling of the frame, shape
+    (2, grid, grid, 3). Tiles are area averages of a strided proxy, so this stays cheap at
+    any frame size. With weights, tiles the mask does not reach take the moments of the
+    whole weighted region.
+    """
+    lab = np.ascontiguousarray(stats_proxy(lab, TILE_STATS_RESOLUTION), dtype=np.float32)
+    if weights is None:
+        weights = np.ones(lab.shape[:2], dtype=np.float32)
+    weights = np.ascontiguousarray(stats_proxy(weights, TILE_STATS_RESOLUTION), dtype=np.float32)
+
+    size = (grid, grid)
+    weighted = lab * cv2.cvtColor(weights, cv2.COLOR_GRAY2RGB)
+    sums = np.stack([
+        cv2.resize(weighted, size, interpolation=cv2.INTER_AREA),
+        cv2.resize(weighted * lab, size, interpolation=cv2.INTER_AREA),
+    ]).astype(np.float64)
+    coverage = cv2.resize(weights, size, interpolation=cv2.INTER_AREA)[..., np.newaxis].astype(np.float64)
+
+    moments = sums / np.maximum(coverage, 1e-6)
+    empty = coverage < 1e-6
+    if empty.any():
+        overall = sums.sum(axis=(1, 2), keepdims=True) / coverage.sum()
+        moments = np.where(empty, overall, moments)
+    return moments
+
+
+def tile_stats(moments):
+    """Per-tile mean and std from (..., 2, grid, grid, 3) tile moments."""
+    mean = moments[..., 0, :, :, :]
+    return {
+        "tile_mean": mean,
+        "tile_std": np.sqrt(np.maximum(moments[..., 1, :, :, :] - mean * mean, 0.0)),
+    }
+
+
+def batch_moments(lab, weights=None):
+    """
+    lab_moments for a (B, H, W, 3) batch of 8-bit LAB frames, shape (B, 3, 3).
+    Each chunk of pixels is taken from every frame and reduced with one batched matmul.
+    """
+    count = lab.shape[0]
+    pixels = lab.reshape(count, -1, 3)
+    if weights is not None:
+        weights = weights.reshape(count, -1)
+    gram = np.zeros((count, 3, 3))
+    step = max(1, STATS_CHUNK // count)
+    for start in range(0, pixels.shape[1], step):
+        chunk = pixels[:, start:start + step].astype(np.float64)
+        if weights is None:
+            gram += np.matmul(chunk.transpose(0, 2, 1), chunk)
+        else:
+            gram += np.matmul((chunk * weights[:, start:start + step, np.newaxis]).transpose(0, 2, 1), chunk)
+    total = pixels.shape[1] if weights is None else weights.sum(axis=1, dtype=np.float64)[:, np.newaxis, np.newaxis]
+    return gram / total
+
+
+def moving_average(values, window):
+    """
+    Centered moving average of window frames along axis 0, shifted inward at the ends
+    of the batch so every frame averages the same number of frames where possible.
+    """
+    count = values.shape[0]
+    csum = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    start = np.clip(np.arange(count) - (window - 1) // 2, 0, None)
+    end = np.minimum(start + window, count)
+    start = np.maximum(end - window, 0)
+    span = (end - start).reshape((-1,) + (1,) * (values.ndim - 1))
+    return (csum[end] - csum[start]) / span
+
+
+def temporal_stats(hists, window, moments=None):
+    """
+    Smooth per-frame (B, 3, 256) histograms (and optional (B, 3, 3) second moments) over
+    time and return per-frame stats dicts. Mean, spread and covariance are linear in the
+    histograms and moments, so they are averaged over time too.
+    """
+    stats = histogram_stats(moving_average(hists, window))
+    if moments is not None:
+        mean = stats["mean"]
+        stats["cov"] = moving_average(moments, window) - mean[:, :, np.newaxis] * mean[:, np.newaxis, :]
+    return [{key: value[i] for key, value in stats.items()} for i in range(hists.shape[0])]
+
+
+def image_stats(image, resolution="exact", mask=None, grid=None):
+    """
+    Return the LAB statistics of every frame of an IMAGE as a tuple of dicts,
+    weighted by the matching MASK frame when a mask is given. With grid, the dicts
+    also hold per-tile mean and std for local matching.
+    Frames are keyed by a hash of the pixels (and weights) the stats are sampled from,
+    so a reference that was seen before is never converted to LAB or analyzed again.
+    """
+    frames = image_view(image)
+    masks = mask_batch(mask, *frames.shape[:3]) if mask is not None else None
+
+    stats = []
+    for i, frame in enumerate(frames):
+        proxy = np.ascontiguousarray(stats_proxy(frame[..., :3], resolution))
+        weights = stats_weights(masks[i], resolution) if masks is not None else None
+        if weights is not None:
+            weights = np.ascontiguousarray(weights)
+        key = ("color_stats", fingerprint(proxy), fingerprint(weights) if weights is not None else None, grid)
+        entry = STATS_CACHE.get(key)
+        if entry is None:
+            lab = rgb_to_lab(proxy)
+            entry = lab_stats(to_lab8(lab), weights=weights)
+            if grid:
+                entry.update(tile_stats(tile_moments(lab, grid, weights)))
+            for value in entry.values():
+                value.flags.writeable = False
+            STATS_CACHE.put(key, entry)
+        stats.append(entry)
+    return tuple(stats)
@@ -1,7 +1,7 @@
-import torch
 import numpy as np
 import json
-import cv2
+import functools
+from .image_utils import image_view, image_tensor, mask_batch
 
 class CurvesAdjustPro:
     """
@@ -123,6 +123,7 @@ class CurvesAdjustPro:
             "optional": {
                 "mask": ("MASK",),
                 "invert_mask": ("BOOLEAN", {"default": False}),
+                "resolution": (["256", "4096", "65536"], {"default": "256"}),
             },
         }
 
@@ -130,7 +131,8 @@ class CurvesAdjustPro:
     FUNCTION = "apply_curves"
     CATEGORY = "MachinePaintingNodes/Color"
 
-    def catmull_rom_spline(self, points, num_samples=256):
+    @staticmethod
+    def catmull_rom_spline(points, num_samples=256):
         """Smooth curve using weighted tangent averaging - no S-curves."""
         if len(points) < 2:
             return np.linspace(0, 1, num_samples)
@@ -144,13 +146,10 @@ class CurvesAdjustPro:
             points.append([1, points[-1][1]])
         
         n = len(points)
+        x = np.arange(num_samples) / (num_samples - 1)
         
         if n == 2:
-            lut = np.zeros(num_samples)
-            for i in range(num_samples):
-                t = i / (num_samples - 1)
-                lut[i] = points[0][1] + (points[1][1] - points[0][1]) * t
-            return lut
+            return points[0][1] + (points[1][1] - points[0][1]) * x
         
         # Calculate tangents using weighted average
         tangents = []
@@ -168,49 +167,53 @@ class CurvesAdjustPro:
                 s1 = dy1 / dx1
                 tangents.append((s0 * dx1 + s1 * dx0) / (dx0 + dx1))
         
-        lut = np.zeros(num_samples)
+        px = np.array([p[0] for p in points], dtype=np.float64)
+        py = np.array([p[1] for p in points], dtype=np.float64)
+        tangents = np.array(tangents, dtype=np.float64)
         
-        for i in range(num_samples):
-            x = i / (num_samples - 1)
-            
-            # Find segment
-            seg = 0
-            for j in range(n - 1):
-                if points[j][0] <= x <= points[j + 1][0]:
-                    seg = j
-                    break
-                if j == n - 2:
-                    seg = j
-            
-            p1 = points[seg]
-            p2 = points[seg + 1]
-            h = p2[0] - p1[0]
-            t = (x - p1[0]) / h if h > 0.0001 else 0
-            
-            m1 = tangents[seg] * h
-            m2 = tangents[seg + 1] * h
-            
-            t2 = t * t
-            t3 = t2 * t
-            
-            h00 = 2*t3 - 3*t2 + 1
-            h10 = t3 - 2*t2 + t
-            h01 = -2*t3 + 3*t2
-            h11 = t3 - t2
-            
-            y = h00 * p1[1] + h10 * m1 + h01 * p2[1] + h11 * m2
-            
-            lut[i] = np.clip(y, 0, 1)
+        # Find segment: the first one containing x, the last one for x outside the points
+        seg = np.clip(np.searchsorted(px, x, side="left") - 1, 0, n - 2)
+        seg[x < px[0]] = n - 2
         
+        x1 = px[seg]
+        h = px[seg + 1] - x1
+        valid = h > 0.0001
+        t = np.where(valid, (x - x1) / np.where(valid, h, 1.0), 0.0)
+        
+        m1 = tangents[seg] * h
+        m2 = tangents[seg + 1] * h
+        
+        t2 = t * t
+        t3 = t2 * t
+        
+        h00 = 2*t3 - 3*t2 + 1
+        h10 = t3 - 2*t2 + t
+        h01 = -2*t3 + 3*t2
+        h11 = t3 - t2
+        
+        y = h00 * py[seg] + h10 * m1 + h01 * py[seg + 1] + h11 * m2
+        
+        return np.clip(y, 0, 1)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def curve_lut(points, num_samples=256):
+        """Build (once) the LUT for a tuple of curve points. The result is shared, so read-only."""
+        lut = CurvesAdjustPro.catmull_rom_spline([list(p) for p in points], num_samples)
+        lut.flags.writeable = False
         return lut
 
-    def apply_lut(self, channel, lut):
-        indices = (channel * 255).astype(np.int32)
-        indices = np.clip(indices, 0, 255)
-        return lut[indices]
+    @classmethod
+    def precompute_presets(cls):
+        """Build every preset's LUTs up front so the first run of a preset hits the cache."""
+        for curves in cls.PRESETS.values():
+            for ch in ["rgb", "red", "green", "blue"]:
+                cls.curve_lut(tuple(tuple(p) for p in curves[ch]))
 
-    def apply_curves(self, image, curve_data, preset="none", mask=None, invert_mask=False):
-        # Parse curve data
+    @classmethod
+    @functools.lru_cache(maxsize=128)
+    def curve_points(cls, curve_data, preset):
+        """Parse curve_data (or fall back to the preset) into hashable (rgb, red, green, blue) point tuples."""
         try:
             curves = json.loads(curve_data)
         except:
@@ -220,57 +223,105 @@ class CurvesAdjustPro:
         all_empty = all(len(curves.get(ch, [])) == 0 for ch in ["rgb", "red", "green", "blue"])
         
         if all_empty and preset != "none":
-            curves = self.PRESETS.get(preset, curves)
-        
-        img = image[0].cpu().numpy().astype(np.float32)
-        original = img.copy()
-        result = img.copy()
+            curves = cls.PRESETS.get(preset, curves)
         
-        # Apply curves
-        rgb_points = curves.get("rgb", [])
-        r_points = curves.get("red", [])
-        g_points = curves.get("green", [])
-        b_points = curves.get("blue", [])
-        
-        if len(rgb_points) >= 2:
-            rgb_lut = self.catmull_rom_spline(rgb_points)
-            for ch in range(3):
-                result[:, :, ch] = self.apply_lut(result[:, :, ch], rgb_lut)
+        return tuple(
+            tuple(tuple(p) for p in curves.get(ch, []))
+            for ch in ["rgb", "red", "green", "blue"]
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def composed_luts(rgb_points, r_points, g_points, b_points, resolution=256):
+        """
+        Fold the master RGB curve into each channel curve: one (channels, table) pair per curve set.
+        channels lists the RGB channels that have any curve, table holds one clipped float32 LUT
+        per listed channel, flattened so the whole image is mapped with a single gather.
+        """
+        grid = np.arange(resolution) / (resolution - 1)
+        rgb_lut = CurvesAdjustPro.curve_lut(rgb_points, resolution) if len(rgb_points) >= 2 else None
         
-        if len(r_points) >= 2:
-            r_lut = self.catmull_rom_spline(r_points)
-            result[:, :, 0] = self.apply_lut(result[:, :, 0], r_lut)
+        channels = []
+        tables = []
+        for ch, points in enumerate([r_points, g_points, b_points]):
+            ch_lut = CurvesAdjustPro.curve_lut(points, resolution) if len(points) >= 2 else None
+            if rgb_lut is None and ch_lut is None:
+                continue
+            if ch_lut is None:
+                lut = rgb_lut
+            elif rgb_lut is None:
+                lut = ch_lut
+            elif resolution == 256:
+                # Same 8-bit truncation the image goes through, so composing is exact
+                lut = ch_lut[CurvesAdjustPro.lut_indices(rgb_lut.astype(np.float32), resolution)]
+            else:
+                lut = np.interp(rgb_lut, grid, ch_lut)
+            channels.append(ch)
+            tables.append(np.clip(lut, 0, 1).astype(np.float32))
         
-        if len(g_points) >= 2:
-            g_lut = self.catmull_rom_spline(g_points)
-            result[:, :, 1] = self.apply_lut(result[:, :, 1], g_lut)
+        if not channels:
+            return (), None
+        table = np.concatenate(tables)
+        table.flags.writeable = False
+        return tuple(channels), table
+
+    @staticmethod
+    def lut_indices(values, resolution=256):
+        """
+        Map 0-1 values to LUT indices. 256 entries keep the classic truncating 8-bit lookup,
+        larger tables round to the nearest entry.
+        """
+        indices = np.multiply(values, resolution - 1, dtype=np.float32)
+        if resolution > 256:
+            indices += 0.5
+        np.clip(indices, 0, resolution - 1, out=indices)
+        return indices.astype(np.int32)
+
+    def map_channels(self, values, table, resolution):
+        """Look up (..., C) values in a flattened table of C stacked LUTs."""
+        indices = self.lut_indices(values, resolution)
+        indices += np.arange(values.shape[-1], dtype=np.int32) * resolution
+        return table[indices]
+
+    def map_curves(self, img, curve_data, preset="none", resolution=256):
+        """Apply the curves of curve_data (or the preset) to a float (..., C) array."""
+        # Parsed points and built LUTs are memoized, so repeated runs skip both
+        rgb_points, r_points, g_points, b_points = self.curve_points(curve_data, preset)
+        channels, table = self.composed_luts(rgb_points, r_points, g_points, b_points, resolution)
         
-        if len(b_points) >= 2:
-            b_lut = self.catmull_rom_spline(b_points)
-            result[:, :, 2] = self.apply_lut(result[:, :, 2], b_lut)
+        # Apply the composed curves in one gather; channels without a curve are only clipped
+        channels = list(channels)
+        if len(channels) == img.shape[-1]:
+            return self.map_channels(img, table, resolution)
         
-        result = np.clip(result, 0, 1)
+        result = np.clip(img, 0, 1)
+        if channels:
+            result[..., channels] = self.map_channels(img[..., channels], table, resolution)
+        return result
+
+    def apply_curves(self, image, curve_data, preset="none", mask=None, invert_mask=False,
+                     resolution="256"):
+        # Curves are per-value LUTs, so the whole [B, H, W, C] batch is mapped at once
+        img = image_view(image)
+        original = img
+        result = self.map_curves(img, curve_data, preset, int(resolution))
         
-        # Apply mask if provided
+        # Apply mask if provided (one mask for all frames, or one per frame)
         if mask is not None:
-            # Get mask as numpy
-            if len(mask.shape) == 3:
-                mask_np = mask[0].cpu().numpy()
-            else:
-                mask_np = mask.cpu().numpy()
-            
-            # Resize mask if needed
-            if mask_np.shape[:2] != img.shape[:2]:
-                mask_np = cv2.resize(mask_np, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR)
+            batch, height, width = img.shape[:3]
+            mask_np = mask_batch(mask, batch, height, width)
             
             # Invert if requested
             if invert_mask:
                 mask_np = 1.0 - mask_np
             
             # Blend original and result using mask
-            mask_3ch = np.stack([mask_np, mask_np, mask_np], axis=2)
+            mask_3ch = mask_np[..., np.newaxis]
             result = original * (1 - mask_3ch) + result * mask_3ch
         
-        result_tensor = torch.from_numpy(result).unsqueeze(0)
+        result_tensor = image_tensor(result)
         
         return (result_tensor,)
+
+
+CurvesAdjustPro.precompute_presets()
@@ -0,0 +1,157 @@
+import os
+import numpy as np
+from .image_utils import image_view, image_tensor
+from .lut_apply import LUTApply, LUT_CACHE
+from .tonal_adjust import LevelsAdjust, BrightnessContrastAdjust
+from .curves_adjust_pro import CurvesAdjustPro
+from .selective_color_pro import SelectiveColorPro
+from .color_blend import ColorAdjustBlend
+
+
+class GradeStack(LUTApply):
+    """
+    Fuse a typical grade into one 3D LUT pass:
+    Levels -> Brightness/Contrast -> Curves -> Selective Color -> Color Balance -> LUT.
+    Every step is the same per-pixel math as its standalone node, run once on a LUT
+    lattice instead of on every frame. The baked LUT is cached by its parameters and
+    can be exported as a .cube file or passed on as a LUT to LUT Apply.
+    """
+
+    GRADE_SIZES = ["33", "65"]
+    BALANCE_INPUTS = ["r_shadows", "g_shadows", "b_shadows",
+                      "r_midtones", "g_midtones", "b_midtones",
+                      "r_highlights", "g_highlights", "b_highlights"]
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        slider = {"min": -100.0, "max": 100.0, "step": 1.0, "display": "slider"}
+        optional = {
+            # Levels
+            "black_point": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 0.5, "step": 0.01, "display": "slider"}),
+            "white_point": ("FLOAT", {"default": 1.0, "min": 0.5, "max": 1.0, "step": 0.01, "display": "slider"}),
+            "gamma": ("FLOAT", {"default": 1.0, "min": 0.1, "max": 3.0, "step": 0.05, "display": "slider"}),
+            "output_black": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 0.5, "step": 0.01, "display": "slider"}),
+            "output_white": ("FLOAT", {"default": 1.0, "min": 0.5, "max": 1.0, "step": 0.01, "display": "slider"}),
+            # Brightness / contrast
+            "brightness": ("FLOAT", {"default": 0.0, **slider}),
+            "contrast": ("FLOAT", {"default": 0.0, **slider}),
+            # Curves
+            "curve_data": ("STRING", {
+                "default": '{"rgb":[[0,0],[1,1]],"red":[[0,0],[1,1]],"green":[[0,0],[1,1]],"blue":[[0,0],[1,1]]}',
+                "multiline": False,
+            }),
+            "curve_preset": (list(CurvesAdjustPro.PRESETS.keys()), {"default": "none"}),
+            # Selective color
+            "target_color": (SelectiveColorPro.COLOR_RANGES, {"default": "reds"}),
+            "cyan": ("FLOAT", {"default": 0.0, **slider}),
+            "magenta": ("FLOAT", {"default": 0.0, **slider}),
+            "yellow": ("FLOAT", {"default": 0.0, **slider}),
+            "black": ("FLOAT", {"default": 0.0, **slider}),
+        }
+        # Color balance
+        for name in cls.BALANCE_INPUTS:
+            optional[name] = ("FLOAT", {"default": 0.0, "min": -100.0, "max": 100.0, "step": 5.0, "display": "slider"})
+        # Final LUT and output
+        optional["lut_file"] = (cls.list_lut_files(), {"default": "none"})
+        optional["lut_intensity"] = ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"})
+        optional["interpolation"] = (cls.INTERPOLATION_MODES, {"default": "trilinear"})
+        optional["export_cube"] = ("BOOLEAN", {"default": False})
+        optional["cube_name"] = ("STRING", {"default": "grade_stack"})
+        optional["overwrite_cube"] = ("BOOLEAN", {"default": False})
+
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "grade_size": (cls.GRADE_SIZES, {"default": "33"}),
+            },
+            "optional": optional,
+        }
+
+    RETURN_TYPES = ("IMAGE", "LUT")
+    RETURN_NAMES = ("image", "lut")
+    FUNCTION = "apply_grade"
+    CATEGORY = "MachinePaintingNodes/Color"
+
+    def apply_grade(self, image, grade_size="33",
+                    black_point=0.0, white_point=1.0, gamma=1.0, output_black=0.0, output_white=1.0,
+                    brightness=0.0, contrast=0.0,
+                    curve_data="", curve_preset="none",
+                    target_color="reds", cyan=0.0, magenta=0.0, yellow=0.0, black=0.0,
+                    r_shadows=0.0, g_shadows=0.0, b_shadows=0.0,
+                    r_midtones=0.0, g_midtones=0.0, b_midtones=0.0,
+                    r_highlights=0.0, g_highlights=0.0, b_highlights=0.0,
+                    lut_file="none", lut_intensity=1.0, interpolation="trilinear",
+                    export_cube=False, cube_name="grade_stack", overwrite_cube=False):
+        grade_size = int(grade_size)
+
+        # The final LUT is keyed by its file key, so an edited file rebakes the grade
+        lut_layer = None
+        if lut_file != "none" and lut_intensity > 0:
+            key, entry = self.load_lut_entry(os.path.join(self.LUT_FOLDER, lut_file))
+            if entry is None:
+                print(f"LUT file not found or invalid: {lut_file}")
+            else:
+                lut_layer = (key, entry)
+
+        steps = (
+            (black_point, white_point, gamma, output_black, output_white),
+            (brightness, contrast),
+            (curve_data, curve_preset),
+            (target_color, cyan, magenta, yellow, black),
+            (r_shadows, g_shadows, b_shadows, r_midtones, g_midtones, b_midtones,
+             r_highlights, g_highlights, b_highlights),
+            (lut_layer[0] if lut_layer else None, lut_intensity),
+        )
+        grade_key = ("grade", steps, grade_size, interpolation)
+        grade = LUT_CACHE.get(grade_key)
+        if grade is None:
+            lut = self.bake_grade(steps, lut_layer, grade_size, interpolation)
+            lut.flags.writeable = False
+            grade = {"key": grade_key, "lut": lut, "size": grade_size}
+            LUT_CACHE.put(grade_key, grade)
+
+        if export_cube:
+            self.export_lut(grade, cube_name, "grade_stack", overwrite_cube)
+
+        img = image_view(image)
+        result = self.apply_3d_lut(img, grade["lut"], grade["size"], interpolation)
+        np.clip(result, 0, 1, out=result)
+
+        return (image_tensor(result), grade)
+
+    def bake_grade(self, steps, lut_layer, grade_size, interpolation="trilinear"):
+        """
+        Run the grade chain on an identity lattice. Neutral steps are skipped.
+        Selective color skips its 3x3 mask blur (the lattice is not an image) and curves are
+        sampled at 65536 entries, since lattice values carry no 8-bit quantization.
+        """
+        levels, bc, curves, selective, balance, (_, lut_intensity) = steps
+        lattice = self.identity_lattice(grade_size)
+
+        if levels != (0.0, 1.0, 1.0, 0.0, 1.0):
+            lattice = LevelsAdjust.levels(lattice, *levels)
+
+        if any(bc):
+            lattice = BrightnessContrastAdjust.brightness_contrast(lattice, *bc)
+
+        lattice = CurvesAdjustPro().map_curves(lattice, *curves, resolution=65536)
+
+        target_color, cyan, magenta, yellow, black = selective
+        if cyan or magenta or yellow or black:
+            selective_color = SelectiveColorPro()
+            color_mask = selective_color.get_color_mask(lattice, target_color, smooth=False)
+            lattice = selective_color.apply_cmyk_adjustment(lattice, color_mask, cyan, magenta, yellow, black)
+
+        if any(balance):
+            lattice = ColorAdjustBlend.color_balance(lattice, *balance)
+
+        if lut_layer is not None:
+            _, entry = lut_layer
+            result = self.apply_3d_lut(lattice, entry["lut"], entry["size"], interpolation)
+            if lut_intensity < 1.0:
+                result -= lattice
+                result *= lut_intensity
+                result += lattice
+            lattice = result
+
+        return np.clip(lattice, 0, 1).astype(np.float32)
@@ -0,0 +1,161 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+import torch
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def batch_index(i, count):
+    """
+    Map output frame i onto a batch of count items.
+    A single item is reused for every frame (1->N), equal batches pair up (N->N),
+    and other sizes cycle like ComfyUI's repeat_to_batch_size.
+    """
+    return i % count
+
+
+def image_view(image):
+    """
+    Return an IMAGE tensor as a float32 (B, H, W, C) NumPy array.
+    A contiguous float32 CPU tensor is shared without a copy, so the view is
+    marked read-only; nodes write their results into new arrays.
+    """
+    array = image.detach().cpu().numpy()
+    if array.dtype == np.float32 and array.flags.c_contiguous:
+        array = array.view()
+        array.flags.writeable = False
+        return array
+    return np.ascontiguousarray(array, dtype=np.float32)
+
+
+def to_uint8(array):
+    """Convert a float 0-1 array to uint8 by truncation, as the OpenCV paths always have."""
+    scaled = np.multiply(array, 255.0, dtype=np.float32)
+    return scaled.astype(np.uint8)
+
+
+def mask_batch(mask, batch_size, height, width):
+    """
+    Return a MASK as a (batch_size, height, width) float32 array.
+    Accepts 2D, batched (B, H, W) or (B, H, W, 1) masks. Frames are resized to the
+    image size when needed and a single mask is broadcast to every frame as a view.
+    """
+    mask_np = image_view(mask)
+    if mask_np.ndim == 2:
+        mask_np = mask_np[np.newaxis]
+    elif mask_np.ndim == 4:
+        mask_np = mask_np[..., 0]
+
+    if mask_np.shape[1:] != (height, width):
+        mask_np = np.stack([
+            cv2.resize(m, (width, height), interpolation=cv2.INTER_LINEAR) for m in mask_np
+        ])
+
+    count = mask_np.shape[0]
+    if count == batch_size:
+        return mask_np
+    if count == 1:
+        return np.broadcast_to(mask_np, (batch_size, height, width))
+    return mask_np[[batch_index(i, count) for i in range(batch_size)]]
+
+
+def mask_channels(mask, channels=3):
+    """Broadcast a (..., H, W) mask to (..., H, W, channels) without copying it."""
+    return np.broadcast_to(mask[..., np.newaxis], mask.shape + (channels,))
+
+
+def transform_channels(array, matrix, offset=(0.0, 0.0, 0.0)):
+    """
+    Return matrix @ pixel + offset for every pixel of a (..., 3) float32 array.
+    Runs as a single OpenCV pass, which is far faster than broadcasting over the last axis.
+    """
+    affine = np.empty((3, 4), dtype=np.float32)
+    affine[:, :3] = matrix
+    affine[:, 3] = offset
+    pixels = np.ascontiguousarray(array, dtype=np.float32).reshape(-1, 1, 3)
+    return cv2.transform(pixels, affine).reshape(array.shape)
+
+
+def scale_channels(array, gain, offset=(0.0, 0.0, 0.0)):
+    """Return array * gain + offset per channel for any (..., 3) float32 array."""
+    return transform_channels(array, np.diag(gain), offset)
+
+
+def guided_upsample(coarse, guide, radius=4, eps=1e-3, resolution=256):
+    """
+    Upsample a coarse (h, w, C) float32 map to the size of a (H, W) guide with a fast
+    guided filter, so changes in the map follow edges in the guide instead of the grid.
+    The filter is solved on a copy of the guide with its longer side at resolution;
+    only its linear coefficients are resized to full size and applied there.
+    """
+    height, width = guide.shape
+    scale = max(1.0, max(height, width) / resolution)
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    channels = coarse.shape[-1]
+    ksize = (2 * radius + 1, 2 * radius + 1)
+
+    small = cv2.resize(guide, size, interpolation=cv2.INTER_AREA)
+    target = cv2.resize(coarse, size, interpolation=cv2.INTER_LINEAR).reshape(size[1], size[0], channels)
+    mean_guide = cv2.boxFilter(small, -1, ksize)
+    var_guide = cv2.boxFilter(small * small, -1, ksize) - mean_guide * mean_guide
+    mean_target = cv2.boxFilter(target, -1, ksize).reshape(target.shape)
+    cov = cv2.boxFilter(target * small[..., np.newaxis], -1, ksize).reshape(target.shape)
+    cov -= mean_target * mean_guide[..., np.newaxis]
+
+    a = cov / (var_guide + eps)[..., np.newaxis]
+    b = mean_target - a * mean_guide[..., np.newaxis]
+    a = cv2.boxFilter(a, -1, ksize)
+    b = cv2.boxFilter(b, -1, ksize)
+
+    # Full resolution: one resize per coefficient and a multiply-add against the guide
+    result = cv2.resize(a, (width, height), interpolation=cv2.INTER_LINEAR).reshape(height, width, channels)
+    result *= cv2.merge([guide] * channels)
+    result += cv2.resize(b, (width, height), interpolation=cv2.INTER_LINEAR).reshape(height, width, channels)
+    return result
+
+
+def image_tensor(array):
+    """Wrap a float32 NumPy result as an IMAGE/MASK tensor, sharing its memory."""
+    return torch.from_numpy(np.ascontiguousarray(array, dtype=np.float32))
+
+
+def frames_to_image(frames, count):
+    """
+    Collect per-frame results into one float32 IMAGE tensor.
+    Frames are written straight into a preallocated batch; uint8 frames are
+    rescaled to 0-1 on the way in, so no intermediate stack is kept.
+    """
+    batch = None
+    for i, frame in enumerate(frames):
+        if batch is None:
+            batch = np.empty((count,) + frame.shape, dtype=np.float32)
+        if frame.dtype == np.uint8:
+            np.divide(frame, np.float32(255.0), out=batch[i], dtype=np.float32)
+        else:
+            batch[i] = frame
+    return torch.from_numpy(batch)
+
+
+def get_executor():
+    """Return the thread pool shared by all banded per-pixel work."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1,
+                                           thread_name_prefix="machinepainting")
+        return _executor
+
+
+def map_bands(count, band, run_band):
+    """Call run_band(start) for every band of count items, in parallel when there are several."""
+    starts = range(0, count, band)
+    if len(starts) <= 1:
+        for start in starts:
+            run_band(start)
+    else:
+        # NumPy releases the GIL inside gathers and arithmetic, so bands run in parallel
+        list(get_executor().map(run_band, starts))
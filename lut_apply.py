@@ -1,48 +1,177 @@
-import torch
 import numpy as np
+import cv2
+import hashlib
+import io
+import json
 import os
+import re
+import struct
 import shutil
+import warnings
+import threading
+from collections import OrderedDict
 import folder_paths
+from .image_utils import image_view, image_tensor, map_bands
+
+
+class LUTCache:
+    """
+    Process-wide LRU cache for parsed LUT data.
+    Entries are keyed by (path, file size, mtime) so an edited LUT is parsed again
+    automatically. Once the resident size exceeds max_bytes the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resident_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_key(path):
+        """Build a cache key that changes whenever the file is modified."""
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+    @staticmethod
+    def entry_bytes(entry):
+        """Sum the sizes of all arrays held by an entry."""
+        return sum(v.nbytes for v in entry.values() if isinstance(v, np.ndarray))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Insert or replace an entry, then evict until under the memory cap."""
+        nbytes = self.entry_bytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.resident_bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.resident_bytes += nbytes
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.resident_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the cap
+        while self.resident_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.resident_bytes -= nbytes
+            self.evictions += 1
+
+
+# Memory cap can be set with MACHINEPAINTING_LUT_CACHE_MB (default 1024 MB)
+LUT_CACHE = LUTCache(int(os.environ.get("MACHINEPAINTING_LUT_CACHE_MB", "1024")) * 1024 * 1024)
+
 
 class LUTApply:
     """
     Apply LUT (Look-Up Table) color grading files to images.
     Supports .cube and .3dl formats.
     LUT files should be placed in ComfyUI/input/luts/
-    Bundled LUTs are automatically copied on first use.
+    Bundled LUTs are automatically copied when the node pack loads.
+    Parsed LUTs are kept in the shared LUT_CACHE, so each file is only parsed once.
     """
     
     LUT_FOLDER = os.path.join(folder_paths.get_input_directory(), "luts")
     BUNDLED_LUTS = os.path.join(os.path.dirname(os.path.realpath(__file__)), "luts")
-    
+    # 1D-only .cube files are expanded to a 3D LUT of at most this size
+    MAX_EXPANDED_1D_SIZE = 65
+    # Pixels per band handed to one worker by apply_3d_lut
+    TILE_PIXELS = 1 << 16
+    INTERPOLATION_MODES = ["trilinear", "tetrahedral"]
+    LUT_EXTENSIONS = ('.cube', '.3dl')
+    # Parsed LUTs are compiled to <lut folder>/.compiled/<name>.<size>-<mtime_ns>.mplut and memory-mapped.
+    # Each source version gets its own file, so a sidecar that is still mapped is never replaced
+    COMPILED_FOLDER = ".compiled"
+    COMPILED_MAGIC = b"MPLUT\x00"
+    # Bump when parsing changes so existing compiled files are rebuilt
+    COMPILED_VERSION = 2
+    _lut_index = None
+    _lut_index_mtime = None
+    _lut_index_lock = threading.Lock()
+
     @classmethod
-    def INPUT_TYPES(cls):
+    def install_bundled_luts(cls):
+        """Create the LUT folder and copy bundled LUTs that are not installed yet."""
         # Create luts folder if it doesn't exist
         if not os.path.exists(cls.LUT_FOLDER):
             os.makedirs(cls.LUT_FOLDER)
             print(f"[MachinePaintingNodes] Created LUT folder: {cls.LUT_FOLDER}")
         
-        # Copy bundled LUTs if they exist and haven't been copied yet
-        if os.path.exists(cls.BUNDLED_LUTS):
-            for f in os.listdir(cls.BUNDLED_LUTS):
-                if f.lower().endswith(('.cube', '.3dl')):
-                    src = os.path.join(cls.BUNDLED_LUTS, f)
-                    dst = os.path.join(cls.LUT_FOLDER, f)
-                    if not os.path.exists(dst):
-                        try:
-                            shutil.copy2(src, dst)
-                            print(f"[MachinePaintingNodes] Installed LUT: {f}")
-                        except Exception as e:
-                            print(f"[MachinePaintingNodes] Failed to copy LUT {f}: {e}")
-        
-        # Scan for LUT files
-        lut_files = ["none"]
-        if os.path.exists(cls.LUT_FOLDER):
-            for f in os.listdir(cls.LUT_FOLDER):
-                if f.lower().endswith(('.cube', '.3dl')):
-                    lut_files.append(f)
-        
-        lut_files.sort()
+        if not os.path.exists(cls.BUNDLED_LUTS):
+            return
+        
+        for f in os.listdir(cls.BUNDLED_LUTS):
+            if f.lower().endswith(cls.LUT_EXTENSIONS):
+                src = os.path.join(cls.BUNDLED_LUTS, f)
+                dst = os.path.join(cls.LUT_FOLDER, f)
+                if not os.path.exists(dst):
+                    try:
+                        shutil.copy2(src, dst)
+                        print(f"[MachinePaintingNodes] Installed LUT: {f}")
+                    except Exception as e:
+                        print(f"[MachinePaintingNodes] Failed to copy LUT {f}: {e}")
+
+    @classmethod
+    def list_lut_files(cls):
+        """
+        Return the sorted LUT dropdown entries, including "none".
+        The folder is only rescanned when its mtime changes (a file was added,
+        removed or renamed), so /object_info requests do not list it every time.
+        """
+        try:
+            mtime = os.stat(cls.LUT_FOLDER).st_mtime_ns
+        except OSError:
+            return ["none"]
+        
+        with cls._lut_index_lock:
+            if cls._lut_index is None or mtime != cls._lut_index_mtime:
+                lut_files = ["none"]
+                with os.scandir(cls.LUT_FOLDER) as entries:
+                    for entry in entries:
+                        if entry.name.lower().endswith(cls.LUT_EXTENSIONS):
+                            lut_files.append(entry.name)
+                lut_files.sort()
+                cls._lut_index = lut_files
+                cls._lut_index_mtime = mtime
+            return list(cls._lut_index)
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        lut_files = cls.list_lut_files()
         
         return {
             "required": {
@@ -51,6 +180,10 @@ class LUTApply:
             },
             "optional": {
                 "intensity": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"}),
+                "interpolation": (cls.INTERPOLATION_MODES, {"default": "trilinear"}),
+                "lookup_8bit": ("BOOLEAN", {"default": False}),
+                # A baked LUT from another node (e.g. Grade Stack), used instead of lut_file
+                "lut": ("LUT",),
             }
         }
 
@@ -59,141 +192,450 @@ class LUTApply:
     FUNCTION = "apply_lut"
     CATEGORY = "MachinePaintingNodes/Color"
 
-    def apply_lut(self, image, lut_file, intensity=1.0):
-        if lut_file == "none":
-            return (image,)
-        
-        lut_path = os.path.join(self.LUT_FOLDER, lut_file)
-        
-        if not os.path.exists(lut_path):
-            print(f"LUT file not found: {lut_path}")
-            return (image,)
-        
-        # Load LUT
-        if lut_file.lower().endswith('.cube'):
-            lut, lut_size = self.load_cube(lut_path)
-        elif lut_file.lower().endswith('.3dl'):
-            lut, lut_size = self.load_3dl(lut_path)
+    def apply_lut(self, image, lut_file, intensity=1.0, interpolation="trilinear", lookup_8bit=False,
+                  lut=None):
+        if lut is not None:
+            # LUT objects are cache entries that carry their own key
+            key, entry = lut["key"], lut
         else:
-            return (image,)
-        
-        if lut is None:
-            return (image,)
+            if lut_file == "none":
+                return (image,)
+            
+            lut_path = os.path.join(self.LUT_FOLDER, lut_file)
+            
+            if not os.path.exists(lut_path):
+                print(f"LUT file not found: {lut_path}")
+                return (image,)
+            
+            # Load LUT (parsed once, then served from the cache)
+            key, entry = self.load_lut_entry(lut_path)
+            
+            if entry is None:
+                return (image,)
         
-        # Apply LUT to image
-        img = image[0].cpu().numpy()
-        original = img.copy()
+        # Apply LUT to the whole batch at once, frames are just more pixels
+        img = image_view(image)[..., :3]
         
-        result = self.apply_3d_lut(img, lut, lut_size)
+        if lookup_8bit:
+            # Quantize to 8 bits and gather from the expanded table, no interpolation per pixel
+            table = self.get_8bit_table(key, entry, interpolation)
+            result = self.apply_8bit_table(img, table)
+        else:
+            result = self.apply_3d_lut(img, entry["lut"], entry["size"], interpolation)
         
         # Blend with intensity
         if intensity < 1.0:
-            result = original * (1 - intensity) + result * intensity
+            result -= img
+            result *= intensity
+            result += img
         
-        result = np.clip(result, 0, 1).astype(np.float32)
-        result_tensor = torch.from_numpy(result).unsqueeze(0)
+        np.clip(result, 0, 1, out=result)
+        result_tensor = image_tensor(result)
         
         return (result_tensor,)
 
-    def load_cube(self, filepath):
-        """Load a .cube LUT file."""
+    @classmethod
+    def cache_stats(cls):
+        """Return hit/miss counters and resident bytes of the parsed LUT cache."""
+        return LUT_CACHE.stats()
+
+    def load_lut(self, lut_path):
+        """Load a .cube or .3dl file through the shared parsed LUT cache."""
+        _, entry = self.load_lut_entry(lut_path)
+        if entry is None:
+            return None, 0
+        return entry["lut"], entry["size"]
+
+    def load_lut_entry(self, lut_path):
+        """
+        Return (cache key, cache entry) for a LUT file, parsing it on a cache miss.
+        The entry holds "lut" and "size" plus any tables derived from the LUT.
+        """
         try:
-            lut_size = 0
-            lut_data = []
+            key = LUT_CACHE.file_key(lut_path)
+        except OSError as e:
+            print(f"Error reading LUT file: {e}")
+            return None, None
+        
+        entry = LUT_CACHE.get(key)
+        if entry is None:
+            if not lut_path.lower().endswith(self.LUT_EXTENSIONS):
+                return None, None
+            
+            # Prefer the compiled copy, parse the text file only when it is missing or stale
+            lut, lut_size = self.load_compiled(lut_path)
+            if lut is None:
+                if lut_path.lower().endswith('.cube'):
+                    lut, lut_size = self.load_cube(lut_path)
+                else:
+                    lut, lut_size = self.load_3dl(lut_path)
+                
+                if lut is None:
+                    return None, None
+                
+                self.write_compiled(lut_path, lut, lut_size)
             
+            # Cached arrays are shared between executions, keep them read-only
+            lut.flags.writeable = False
+            entry = {"lut": lut, "size": lut_size}
+            LUT_CACHE.put(key, entry)
+        
+        return key, entry
+
+    @classmethod
+    def compiled_path(cls, lut_path, st=None):
+        """Return the path of the compiled sidecar for the current size/mtime of a LUT file."""
+        st = st or os.stat(lut_path)
+        folder, name = os.path.split(os.path.abspath(lut_path))
+        return os.path.join(folder, cls.COMPILED_FOLDER, f"{name}.{st.st_size}-{st.st_mtime_ns}.mplut")
+
+    @classmethod
+    def compiled_versions(cls, lut_path):
+        """Return the compiled sidecars of every version of a LUT file, newest first."""
+        folder, name = os.path.split(os.path.abspath(lut_path))
+        compiled_folder = os.path.join(folder, cls.COMPILED_FOLDER)
+        pattern = re.compile(re.escape(name) + r"\.\d+-(\d+)\.mplut")
+        try:
+            matches = [(pattern.fullmatch(f), f) for f in os.listdir(compiled_folder)]
+        except OSError:
+            return []
+        versions = sorted(((int(m.group(1)), f) for m, f in matches if m), reverse=True)
+        return [os.path.join(compiled_folder, f) for _, f in versions]
+
+    @staticmethod
+    def file_sha1(path):
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def read_compiled_header(self, path):
+        """Return the JSON header of a compiled LUT, or None if it is not one of the current version."""
+        with open(path, 'rb') as f:
+            prefix = f.read(len(self.COMPILED_MAGIC) + 4)
+            if prefix[:len(self.COMPILED_MAGIC)] != self.COMPILED_MAGIC:
+                return None
+            header_len = struct.unpack('<I', prefix[len(self.COMPILED_MAGIC):])[0]
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        if header.get("version") != self.COMPILED_VERSION:
+            return None
+        return header
+
+    def load_compiled(self, lut_path):
+        """
+        Memory-map the compiled copy of a LUT if it is still valid.
+        The file is a magic string, a uint32 header length, a JSON header and the
+        float32 LUT data aligned to 64 bytes. Mapping it read-only lets every ComfyUI
+        process on the host share the same pages. When only an older version exists
+        (the source was touched or copied), it is reused if the source SHA-1 still
+        matches and written again under the current size/mtime so later starts skip the hash.
+        """
+        path = None
+        try:
+            st = os.stat(lut_path)
+            path = self.compiled_path(lut_path, st)
+            if os.path.exists(path):
+                header = self.read_compiled_header(path)
+                if header is None or (header["source_size"], header["source_mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+                    return None, 0
+            else:
+                versions = self.compiled_versions(lut_path)
+                if not versions:
+                    return None, 0
+                path = versions[0]
+                header = self.read_compiled_header(path)
+                if header is None or header["source_sha1"] != self.file_sha1(lut_path):
+                    return None, 0
+                
+                # Copy the data out instead of mapping it, so the old version can be removed
+                lut_size = header["size"]
+                lut = np.fromfile(path, dtype='<f4', count=lut_size ** 3 * 3, offset=header["data_offset"])
+                path = self.write_compiled(lut_path, lut.reshape(lut_size, lut_size, lut_size, 3), lut_size,
+                                           source_sha1=header["source_sha1"])
+                if path is None:
+                    return lut.reshape(lut_size, lut_size, lut_size, 3), lut_size
+                header = self.read_compiled_header(path)
+            
+            lut_size = header["size"]
+            lut = np.memmap(path, dtype='<f4', mode='r', offset=header["data_offset"],
+                            shape=(lut_size, lut_size, lut_size, 3))
+            return lut, lut_size
+            
+        except Exception as e:
+            print(f"[MachinePaintingNodes] Ignoring compiled LUT {path}: {e}")
+            return None, 0
+
+    def write_compiled(self, lut_path, lut, lut_size, source_sha1=None):
+        """
+        Write the compiled copy of a parsed LUT next to its source file and return its path,
+        or None if it could not be written. source_sha1 skips hashing the source again when
+        the caller already verified it. Other versions are removed when nothing maps them.
+        """
+        path = None
+        try:
+            st = os.stat(lut_path)
+            path = self.compiled_path(lut_path, st)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            header = {
+                "version": self.COMPILED_VERSION,
+                "size": lut_size,
+                "source_size": st.st_size,
+                "source_mtime_ns": st.st_mtime_ns,
+                "source_sha1": source_sha1 or self.file_sha1(lut_path),
+            }
+            # data_offset is part of the header, so size it with a placeholder first
+            prefix_len = len(self.COMPILED_MAGIC) + 4
+            header["data_offset"] = 0
+            header_len = len(json.dumps(header)) + 16
+            header["data_offset"] = (prefix_len + header_len + 63) // 64 * 64
+            header_bytes = json.dumps(header).encode('utf-8')
+            header_bytes += b' ' * (header["data_offset"] - prefix_len - len(header_bytes))
+            
+            # Write to a temporary file and rename so readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(self.COMPILED_MAGIC)
+                f.write(struct.pack('<I', len(header_bytes)))
+                f.write(header_bytes)
+                f.write(np.ascontiguousarray(lut, dtype='<f4').tobytes())
+            os.replace(tmp_path, path)
+            
+        except Exception as e:
+            print(f"[MachinePaintingNodes] Failed to write compiled LUT {path}: {e}")
+            return None
+        
+        for old_path in self.compiled_versions(lut_path):
+            if old_path != path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    # Still mapped by a process on Windows; removed by a later write
+                    pass
+        return path
+
+    @staticmethod
+    def write_cube(path, lut, title=None):
+        """Write a LUT indexed [r, g, b] as a .cube file (red varies fastest)."""
+        lut_size = lut.shape[0]
+        data = np.ascontiguousarray(lut.transpose(2, 1, 0, 3)).reshape(-1, 3)
+        
+        buf = io.StringIO()
+        if title:
+            buf.write(f'TITLE "{title}"\n')
+        buf.write(f"LUT_3D_SIZE {lut_size}\n")
+        np.savetxt(buf, data, fmt="%.6f")
+        
+        # Write to a temporary file and rename so the LUT folder never lists a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(buf.getvalue())
+        os.replace(tmp_path, path)
+
+    def export_lut(self, entry, cube_name, default_name="lut", overwrite=False):
+        """
+        Write a baked LUT object to the LUT folder as <cube_name>.cube, once per LUT.
+        An existing file is only replaced with overwrite; otherwise the export gets the
+        first free <cube_name>_<n>.cube, so bundled and hand-made LUTs are never lost.
+        """
+        name = os.path.basename(cube_name.strip()) or default_name
+        if name.lower().endswith(".cube"):
+            name = name[:-len(".cube")]
+        requested = os.path.join(self.LUT_FOLDER, name + ".cube")
+
+        exported = entry.get("cube_export")
+        if exported and exported[0] == (requested, overwrite) and os.path.exists(exported[1]):
+            return
+        
+        path = requested
+        suffix = 0
+        while not overwrite and os.path.exists(path):
+            suffix += 1
+            path = os.path.join(self.LUT_FOLDER, f"{name}_{suffix}.cube")
+        try:
+            os.makedirs(self.LUT_FOLDER, exist_ok=True)
+            self.write_cube(path, entry["lut"], title=os.path.splitext(os.path.basename(path))[0])
+            entry["cube_export"] = ((requested, overwrite), path)
+            print(f"[MachinePaintingNodes] Exported LUT to {path}")
+        except OSError as e:
+            print(f"[MachinePaintingNodes] Failed to export LUT {path}: {e}")
+
+    def get_8bit_table(self, key, entry, interpolation="trilinear"):
+        """Return the 256^3 packed table for a cache entry, building and caching it once."""
+        name = f"table_8bit_{interpolation}"
+        table = entry.get(name)
+        if table is None:
+            table = self.build_8bit_table(entry["lut"], entry["size"], interpolation)
+            table.flags.writeable = False
+            entry[name] = table
+            # Re-insert so the cache accounts for the table's 64 MB
+            LUT_CACHE.put(key, entry)
+        return table
+
+    def build_8bit_table(self, lut, lut_size, interpolation="trilinear"):
+        """
+        Expand a LUT into a dense table covering every 8-bit RGB input.
+        Each entry packs the 8-bit output as little-endian bytes (r, g, b, 0) in a uint32,
+        indexed by (r << 16) | (g << 8) | b.
+        """
+        ramp = np.arange(256, dtype=np.float32) / 255.0
+        block = 16
+        grid = np.empty((block, 256, 256, 3), dtype=np.float32)
+        grid[..., 1] = ramp[None, :, None]
+        grid[..., 2] = ramp[None, None, :]
+        
+        table = np.empty((256, 256, 256, 4), dtype=np.uint8)
+        table[..., 3] = 0
+        for r in range(0, 256, block):
+            grid[..., 0] = ramp[r:r + block, None, None]
+            rgb = self.apply_3d_lut(grid, lut, lut_size, interpolation)
+            rgb *= 255.0
+            rgb += 0.5
+            np.clip(rgb, 0, 255, out=rgb)
+            table[r:r + block, ..., :3] = rgb
+        
+        return table.reshape(-1).view('<u4')
+
+    def apply_8bit_table(self, image, table):
+        """Quantize an image to 8 bits and map it through a packed 256^3 table."""
+        # Only RGB is graded; an alpha channel is dropped like the original per-frame path did
+        image = image[..., :3]
+        shape = image.shape
+        pixels = np.ascontiguousarray(image, dtype=np.float32).reshape(-1, 3)
+        result = np.empty_like(pixels)
+        
+        def run_band(start):
+            end = start + self.TILE_PIXELS
+            q = pixels[start:end] * 255.0
+            q += 0.5
+            np.clip(q, 0, 255, out=q)
+            q = q.astype(np.uint32)
+            index = (q[:, 0] << 16) | (q[:, 1] << 8) | q[:, 2]
+            packed = table[index].view(np.uint8).reshape(-1, 4)
+            np.multiply(packed[:, :3], np.float32(1.0 / 255.0), out=result[start:end])
+        
+        self.map_bands(pixels.shape[0], run_band)
+        return result.reshape(shape)
+
+    def load_cube(self, filepath):
+        """
+        Load a .cube LUT file.
+        The header is parsed line by line, the numeric body is handed to NumPy in one
+        call. DOMAIN_MIN/DOMAIN_MAX and 1D shaper LUTs are baked into the returned
+        3D LUT, which is always indexed as lut[r, g, b] over a 0-1 input domain.
+        """
+        try:
             with open(filepath, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    
-                    # Skip comments and empty lines
-                    if not line or line.startswith('#'):
-                        continue
-                    
-                    # Parse LUT size
-                    if line.startswith('LUT_3D_SIZE'):
-                        lut_size = int(line.split()[-1])
-                        continue
-                    
-                    # Skip other metadata
-                    if line.startswith(('TITLE', 'DOMAIN_MIN', 'DOMAIN_MAX', 'LUT_1D_SIZE')):
-                        continue
-                    
-                    # Parse color values
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        try:
-                            r, g, b = float(parts[0]), float(parts[1]), float(parts[2])
-                            lut_data.append([r, g, b])
-                        except ValueError:
-                            continue
-            
-            if lut_size == 0 or len(lut_data) == 0:
+                text = f.read()
+            
+            header, body = self.split_lut_header(text)
+            
+            size_3d = 0
+            size_1d = 0
+            domain_min = np.zeros(3, dtype=np.float32)
+            domain_max = np.ones(3, dtype=np.float32)
+            range_1d = None
+            range_3d = None
+            
+            for line in header:
+                parts = line.split()
+                key = parts[0].upper()
+                if key == 'LUT_3D_SIZE':
+                    size_3d = int(parts[1])
+                elif key == 'LUT_1D_SIZE':
+                    size_1d = int(parts[1])
+                elif key == 'DOMAIN_MIN':
+                    domain_min = np.array(parts[1:4], dtype=np.float32)
+                elif key == 'DOMAIN_MAX':
+                    domain_max = np.array(parts[1:4], dtype=np.float32)
+                elif key == 'LUT_1D_INPUT_RANGE':
+                    range_1d = [float(parts[1]), float(parts[2])]
+                elif key == 'LUT_3D_INPUT_RANGE':
+                    range_3d = [float(parts[1]), float(parts[2])]
+            
+            if size_3d == 0 and size_1d == 0:
                 print(f"Invalid .cube file: {filepath}")
                 return None, 0
             
-            # Reshape to 3D LUT
-            lut = np.array(lut_data, dtype=np.float32).reshape((lut_size, lut_size, lut_size, 3))
+            data = self.parse_lut_body(body)
+            expected = size_1d + size_3d ** 3
+            if data.shape[0] != expected:
+                print(f"Invalid .cube file: {filepath} ({data.shape[0]} entries, expected {expected})")
+                return None, 0
             
-            return lut, lut_size
+            # Resolve-style files put the 1D shaper before the 3D table
+            shaper = data[:size_1d] if size_1d else None
+            shaper_min = np.full(3, range_1d[0], np.float32) if range_1d else domain_min
+            shaper_max = np.full(3, range_1d[1], np.float32) if range_1d else domain_max
+            cube_min = np.full(3, range_3d[0], np.float32) if range_3d else domain_min
+            cube_max = np.full(3, range_3d[1], np.float32) if range_3d else domain_max
+            
+            if size_3d:
+                # .cube stores red fastest, transpose so the LUT is indexed [r, g, b]
+                lut = data[size_1d:].reshape((size_3d, size_3d, size_3d, 3)).transpose(2, 1, 0, 3)
+                lut = np.ascontiguousarray(lut)
+                lut_size = size_3d
+            else:
+                lut = None
+                lut_size = min(max(size_1d, 2), self.MAX_EXPANDED_1D_SIZE)
+            
+            if shaper is None and np.allclose(cube_min, 0) and np.allclose(cube_max, 1):
+                return lut, lut_size
+            
+            # Bake shaper and input domain into a unit-domain 3D LUT
+            coords = self.identity_lattice(lut_size)
+            if shaper is not None:
+                coords = self.apply_1d_lut(coords, shaper, shaper_min, shaper_max)
+            if lut is None:
+                return coords, lut_size
+            
+            coords = (coords - cube_min) / np.maximum(cube_max - cube_min, 1e-6)
+            coords = np.clip(coords, 0, 1).reshape(-1, 1, 3)
+            lut = self.apply_3d_lut(coords, lut, lut_size).reshape(lut_size, lut_size, lut_size, 3)
+            
+            return np.ascontiguousarray(lut, dtype=np.float32), lut_size
             
         except Exception as e:
             print(f"Error loading .cube file: {e}")
             return None, 0
 
     def load_3dl(self, filepath):
-        """Load a .3dl LUT file."""
+        """
+        Load a .3dl LUT file.
+        Integer shaper/mesh lines in the header are skipped, the body is parsed in one
+        NumPy call. An all-integer body is scaled by the bit depth implied by its largest
+        value; any fractional value marks a float LUT, which is used unscaled.
+        """
         try:
-            lut_data = []
-            
             with open(filepath, 'r') as f:
-                lines = f.readlines()
-            
-            # Find data start (skip headers)
-            data_start = 0
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        try:
-                            float(parts[0])
-                            data_start = i
-                            break
-                        except ValueError:
-                            continue
-            
-            # Parse data
-            for line in lines[data_start:]:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                parts = line.split()
-                if len(parts) >= 3:
-                    try:
-                        r, g, b = float(parts[0]), float(parts[1]), float(parts[2])
-                        # .3dl typically uses 0-4095 or 0-1023 range
-                        max_val = max(r, g, b)
-                        if max_val > 1:
-                            if max_val > 1023:
-                                r, g, b = r / 4095, g / 4095, b / 4095
-                            else:
-                                r, g, b = r / 1023, g / 1023, b / 1023
-                        lut_data.append([r, g, b])
-                    except ValueError:
-                        continue
-            
-            if len(lut_data) == 0:
+                text = f.read()
+            
+            _, body = self.split_lut_header(text, data_columns=3)
+            data = self.parse_lut_body(body)
+            
+            if data.shape[0] == 0:
                 return None, 0
             
+            # .3dl typically uses 0-1023, 0-4095 or 0-65535 integer ranges. Float LUTs may
+            # overshoot 1 slightly, so only integral bodies are treated as integer codes
+            if np.all(data == np.round(data)):
+                max_val = float(data.max())
+                if max_val > 4095:
+                    data = data / 65535.0
+                elif max_val > 1023:
+                    data = data / 4095.0
+                elif max_val > 1:
+                    data = data / 1023.0
+            
             # Determine LUT size (cube root of data length)
-            lut_size = int(round(len(lut_data) ** (1/3)))
+            lut_size = int(round(data.shape[0] ** (1/3)))
             
-            if lut_size ** 3 != len(lut_data):
-                print(f"Invalid .3dl file size: {len(lut_data)} entries")
+            if lut_size ** 3 != data.shape[0]:
+                print(f"Invalid .3dl file size: {data.shape[0]} entries")
                 return None, 0
             
-            lut = np.array(lut_data, dtype=np.float32).reshape((lut_size, lut_size, lut_size, 3))
+            # .3dl stores blue fastest, which already gives lut[r, g, b]
+            lut = data.astype(np.float32).reshape((lut_size, lut_size, lut_size, 3))
             
             return lut, lut_size
             
@@ -201,45 +643,376 @@ class LUTApply:
             print(f"Error loading .3dl file: {e}")
             return None, 0
 
-    def apply_3d_lut(self, image, lut, lut_size):
-        """Apply 3D LUT to image using trilinear interpolation."""
-        h, w, c = image.shape
+    @staticmethod
+    def split_lut_header(text, data_columns=None):
+        """
+        Split LUT text into header lines and the numeric body.
+        The body starts at the first line beginning with a number. When data_columns
+        is given, numeric lines with a different column count are kept as header.
+        """
+        header = []
+        pos = 0
+        length = len(text)
+        while pos < length:
+            end = text.find('\n', pos)
+            if end == -1:
+                end = length
+            line = text[pos:end].strip()
+            if line and not line.startswith('#'):
+                if line[0] in '0123456789+-.':
+                    if data_columns is None or len(line.split()) == data_columns:
+                        break
+                header.append(line)
+            pos = end + 1
+        return header, text[pos:]
+
+    @staticmethod
+    def parse_lut_body(body):
+        """Parse the numeric body of a LUT file into an (N, 3) float32 array."""
+        if '#' not in body:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error")
+                    values = np.fromstring(body, dtype=np.float32, sep=' ')
+                if values.size % 3 == 0:
+                    return values.reshape(-1, 3)
+            except (ValueError, DeprecationWarning):
+                pass
         
-        # Scale image values to LUT indices
-        img_scaled = image * (lut_size - 1)
+        # Slower fallback for bodies with comments or extra columns
+        values = np.loadtxt(io.StringIO(body), dtype=np.float32, comments='#', usecols=(0, 1, 2), ndmin=2)
+        return values.reshape(-1, 3)
+
+    @staticmethod
+    def identity_lattice(lut_size):
+        """Return the (size, size, size, 3) grid of RGB input values of a LUT."""
+        ramp = np.linspace(0, 1, lut_size, dtype=np.float32)
+        r, g, b = np.meshgrid(ramp, ramp, ramp, indexing='ij')
+        return np.stack([r, g, b], axis=-1)
+
+    @staticmethod
+    def apply_1d_lut(values, lut_1d, domain_min, domain_max):
+        """Apply a per-channel (M, 3) 1D LUT with linear interpolation."""
+        size = lut_1d.shape[0]
+        positions = np.arange(size, dtype=np.float32)
+        result = np.empty_like(values, dtype=np.float32)
+        for c in range(3):
+            scaled = (values[..., c] - domain_min[c]) / max(domain_max[c] - domain_min[c], 1e-6)
+            scaled = np.clip(scaled, 0, 1) * (size - 1)
+            result[..., c] = np.interp(scaled, positions, lut_1d[:, c])
+        return result
+
+    def apply_3d_lut(self, image, lut, lut_size, interpolation="trilinear"):
+        """
+        Apply 3D LUT to image using trilinear or tetrahedral interpolation.
+        Pixels are processed in bands of TILE_PIXELS on a shared thread pool, so the
+        scratch memory stays bounded no matter how large the image is.
+        """
+        # Only RGB is graded; an alpha channel is dropped like the original per-frame path did
+        image = image[..., :3]
+        shape = image.shape
+        pixels = np.ascontiguousarray(image, dtype=np.float32).reshape(-1, 3)
+        flat_lut = np.ascontiguousarray(lut, dtype=np.float32).reshape(-1, 3)
+        result = np.empty_like(pixels)
         
-        # Get integer and fractional parts
-        img_floor = np.floor(img_scaled).astype(np.int32)
-        img_ceil = np.ceil(img_scaled).astype(np.int32)
-        frac = img_scaled - img_floor
+        if interpolation == "tetrahedral":
+            kernel = self.tetrahedral_tile
+        else:
+            kernel = self.trilinear_tile
         
-        # Clamp indices
-        img_floor = np.clip(img_floor, 0, lut_size - 1)
-        img_ceil = np.clip(img_ceil, 0, lut_size - 1)
+        def run_band(start):
+            end = start + self.TILE_PIXELS
+            kernel(pixels[start:end], flat_lut, lut_size, result[start:end])
         
-        # Get corner values for trilinear interpolation
-        r0, g0, b0 = img_floor[:,:,0], img_floor[:,:,1], img_floor[:,:,2]
-        r1, g1, b1 = img_ceil[:,:,0], img_ceil[:,:,1], img_ceil[:,:,2]
-        fr, fg, fb = frac[:,:,0:1], frac[:,:,1:2], frac[:,:,2:3]
+        self.map_bands(pixels.shape[0], run_band)
+        return result.reshape(shape)
+
+    @classmethod
+    def map_bands(cls, count, run_band):
+        """Call run_band(start) for every TILE_PIXELS band of count pixels."""
+        map_bands(count, cls.TILE_PIXELS, run_band)
+
+    @staticmethod
+    def lut_coordinates(pixels, lut_size):
+        """Return the flat index of the lower LUT corner and the fractional offsets."""
+        scaled = pixels * np.float32(lut_size - 1)
+        np.clip(scaled, 0, lut_size - 1, out=scaled)
+        # Clamp to size - 2 so the upper corner always exists (frac becomes 1 at the top)
+        base = np.minimum(scaled.astype(np.int32), lut_size - 2)
+        scaled -= base
+        index = (base[:, 0] * lut_size + base[:, 1]) * lut_size + base[:, 2]
+        return index, scaled
+
+    @staticmethod
+    def trilinear_tile(pixels, flat_lut, lut_size, out):
+        """
+        Trilinear interpolation of one band of (N, 3) pixels into out.
+        flat_lut is (size^3, 3), or (L, size^3, 3) to map the band through L LUTs at once.
+        """
+        index, frac = LUTApply.lut_coordinates(pixels, lut_size)
+        fr, fg, fb = frac[:, 0:1], frac[:, 1:2], frac[:, 2:3]
+        step_r, step_g = lut_size * lut_size, lut_size
         
-        # Trilinear interpolation
-        c000 = lut[r0, g0, b0]
-        c001 = lut[r0, g0, b1]
-        c010 = lut[r0, g1, b0]
-        c011 = lut[r0, g1, b1]
-        c100 = lut[r1, g0, b0]
-        c101 = lut[r1, g0, b1]
-        c110 = lut[r1, g1, b0]
-        c111 = lut[r1, g1, b1]
+        def lerp_blue(offset):
+            low = np.take(flat_lut, index + offset, axis=-2)
+            high = np.take(flat_lut, index + (offset + 1), axis=-2)
+            high -= low
+            high *= fb
+            low += high
+            return low
         
-        c00 = c000 * (1 - fb) + c001 * fb
-        c01 = c010 * (1 - fb) + c011 * fb
-        c10 = c100 * (1 - fb) + c101 * fb
-        c11 = c110 * (1 - fb) + c111 * fb
+        c00 = lerp_blue(0)
+        c01 = lerp_blue(step_g)
+        c10 = lerp_blue(step_r)
+        c11 = lerp_blue(step_r + step_g)
         
-        c0 = c00 * (1 - fg) + c01 * fg
-        c1 = c10 * (1 - fg) + c11 * fg
+        # Green, then red, reusing the corner buffers
+        c01 -= c00
+        c01 *= fg
+        c00 += c01
+        c11 -= c10
+        c11 *= fg
+        c10 += c11
+        c10 -= c00
+        c10 *= fr
+        np.add(c00, c10, out=out)
+
+    @staticmethod
+    def tetrahedral_tile(pixels, flat_lut, lut_size, out):
+        """Tetrahedral interpolation of one band of (N, 3) pixels, four fetches per pixel."""
+        index, frac = LUTApply.lut_coordinates(pixels, lut_size)
+        fr, fg, fb = frac[:, 0], frac[:, 1], frac[:, 2]
+        step_r, step_g, step_b = lut_size * lut_size, lut_size, 1
         
-        result = c0 * (1 - fr) + c1 * fr
+        # Walk from the lower corner along the axis with the largest fraction first
+        r_max = (fr >= fg) & (fr >= fb)
+        g_max = ~r_max & (fg >= fb)
+        step_max = np.where(r_max, step_r, np.where(g_max, step_g, step_b))
+        b_min = (fb <= fg) & (fb <= fr)
+        g_min = ~b_min & (fg <= fr)
+        step_min = np.where(b_min, step_b, np.where(g_min, step_g, step_r))
+        step_mid = (step_r + step_g + step_b) - step_max - step_min
         
-        return result
+        frac.sort(axis=1)
+        f_min, f_mid, f_max = frac[:, 0:1], frac[:, 1:2], frac[:, 2:3]
+        
+        c0 = np.take(flat_lut, index, axis=-2)
+        index += step_max
+        c1 = np.take(flat_lut, index, axis=-2)
+        index += step_mid
+        c2 = np.take(flat_lut, index, axis=-2)
+        index += step_min
+        c3 = np.take(flat_lut, index, axis=-2)
+        
+        c3 -= c2
+        c3 *= f_min
+        c2 -= c1
+        c2 *= f_mid
+        c1 -= c0
+        c1 *= f_max
+        c0 += c1
+        c0 += c2
+        np.add(c0, c3, out=out)
+
+
+# Install bundled LUTs once when the node pack is loaded
+try:
+    LUTApply.install_bundled_luts()
+except OSError as e:
+    print(f"[MachinePaintingNodes] Failed to set up LUT folder: {e}")
+
+
+class LUTStack(LUTApply):
+    """
+    Compose up to three LUTs (e.g. technical transform, look, trim) into a single
+    3D LUT and apply it in one pass.
+    Each layer has its own intensity, mixed the same way as LUTApply. The composite
+    is cached by its inputs, so grading cost does not grow with the number of layers.
+    """
+    
+    LAYERS = 3
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        lut_files = cls.list_lut_files()
+        
+        required = {"image": ("IMAGE",)}
+        optional = {}
+        for i in range(1, cls.LAYERS + 1):
+            required[f"lut_{i}"] = (lut_files, {"default": "none"})
+            optional[f"intensity_{i}"] = ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.05, "display": "slider"})
+        optional["stack_size"] = ("INT", {"default": 65, "min": 2, "max": 129, "step": 1})
+        optional["interpolation"] = (cls.INTERPOLATION_MODES, {"default": "trilinear"})
+        
+        return {"required": required, "optional": optional}
+
+    RETURN_TYPES = ("IMAGE",)
+    RETURN_NAMES = ("image",)
+    FUNCTION = "apply_stack"
+    CATEGORY = "MachinePaintingNodes/Color"
+
+    def apply_stack(self, image, lut_1="none", lut_2="none", lut_3="none",
+                    intensity_1=1.0, intensity_2=1.0, intensity_3=1.0,
+                    stack_size=65, interpolation="trilinear"):
+        layers = []
+        for lut_file, intensity in ((lut_1, intensity_1), (lut_2, intensity_2), (lut_3, intensity_3)):
+            if lut_file == "none" or intensity <= 0:
+                continue
+            
+            key, entry = self.load_lut_entry(os.path.join(self.LUT_FOLDER, lut_file))
+            if entry is None:
+                print(f"LUT file not found or invalid: {lut_file}")
+                continue
+            layers.append((key, entry, intensity))
+        
+        if not layers:
+            return (image,)
+        
+        # Composite depends on the exact files, intensities, resolution and interpolation
+        stack_key = ("stack", tuple((key, intensity) for key, _, intensity in layers),
+                     stack_size, interpolation)
+        stack = LUT_CACHE.get(stack_key)
+        if stack is None:
+            lut = self.compose_luts([(e["lut"], e["size"], i) for _, e, i in layers],
+                                    stack_size, interpolation)
+            lut.flags.writeable = False
+            stack = {"lut": lut, "size": stack_size}
+            LUT_CACHE.put(stack_key, stack)
+        
+        img = image_view(image)
+        result = self.apply_3d_lut(img, stack["lut"], stack["size"], interpolation)
+        np.clip(result, 0, 1, out=result)
+        
+        return (image_tensor(result),)
+
+    def compose_luts(self, layers, stack_size, interpolation="trilinear"):
+        """
+        Resample a chain of (lut, lut_size, intensity) layers into one LUT.
+        Each layer is applied to the lattice of the composite, mixed by its intensity
+        and clipped, matching a chain of LUTApply nodes.
+        """
+        lattice = self.identity_lattice(stack_size)
+        for lut, lut_size, intensity in layers:
+            result = self.apply_3d_lut(lattice, lut, lut_size, interpolation)
+            if intensity < 1.0:
+                result -= lattice
+                result *= intensity
+                result += lattice
+            np.clip(result, 0, 1, out=result)
+            lattice = result
+        return lattice
+
+
+class LUTContactSheet(LUTApply):
+    """
+    Preview every LUT in the LUT folder on a thumbnail of the input image.
+    The image is downsampled once and mapped through all LUTs of the same size in
+    one vectorized pass, producing a labeled grid plus the previews as a batch.
+    LUTs come from the shared parsed LUT cache, so browsing a large folder is fast.
+    """
+    
+    # LUTs mapped together per gather, bounds the scratch memory of one pass
+    LUTS_PER_PASS = 16
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+            },
+            "optional": {
+                "thumbnail_size": ("INT", {"default": 256, "min": 64, "max": 1024, "step": 16}),
+                "columns": ("INT", {"default": 6, "min": 1, "max": 32, "step": 1}),
+                "show_labels": ("BOOLEAN", {"default": True}),
+                "interpolation": (cls.INTERPOLATION_MODES, {"default": "trilinear"}),
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE", "IMAGE", "STRING")
+    RETURN_NAMES = ("contact_sheet", "previews", "lut_names")
+    FUNCTION = "create_contact_sheet"
+    CATEGORY = "MachinePaintingNodes/Color"
+
+    def create_contact_sheet(self, image, thumbnail_size=256, columns=6,
+                             show_labels=True, interpolation="trilinear"):
+        # The sheet previews the first frame of a batch
+        img = image_view(image)[0]
+        thumb = self.make_thumbnail(img, thumbnail_size)
+        th, tw = thumb.shape[:2]
+        
+        # Load every LUT once and group them by size so each group shares coordinates
+        names = []
+        groups = {}
+        for lut_file in self.list_lut_files():
+            if lut_file == "none":
+                continue
+            lut, lut_size = self.load_lut(os.path.join(self.LUT_FOLDER, lut_file))
+            if lut is None:
+                continue
+            groups.setdefault(lut_size, []).append((len(names), lut))
+            names.append(lut_file)
+        
+        previews = np.empty((len(names), th, tw, 3), dtype=np.float32)
+        flat_previews = previews.reshape(len(names), -1, 3)
+        pixels = np.ascontiguousarray(thumb, dtype=np.float32).reshape(-1, 3)
+        kernel = self.tetrahedral_tile if interpolation == "tetrahedral" else self.trilinear_tile
+        
+        for lut_size, members in groups.items():
+            for start in range(0, len(members), self.LUTS_PER_PASS):
+                chunk = members[start:start + self.LUTS_PER_PASS]
+                indices = [index for index, _ in chunk]
+                stacked = np.stack([lut.reshape(-1, 3) for _, lut in chunk])
+                # Same scratch budget as apply_3d_lut: TILE_PIXELS pixel lookups per band
+                band = max(1, self.TILE_PIXELS // len(chunk))
+                
+                def run_band(band_start, stacked=stacked, indices=indices, lut_size=lut_size, band=band):
+                    end = band_start + band
+                    out = np.empty((len(indices), min(end, pixels.shape[0]) - band_start, 3), dtype=np.float32)
+                    kernel(pixels[band_start:end], stacked, lut_size, out)
+                    flat_previews[indices, band_start:end] = out
+                
+                map_bands(pixels.shape[0], band, run_band)
+        
+        np.clip(previews, 0, 1, out=previews)
+        
+        labels = ["original"] + [os.path.splitext(n)[0] for n in names]
+        cells = np.concatenate([thumb[np.newaxis], previews], axis=0)
+        sheet = self.create_grid(cells, labels if show_labels else None, columns)
+        
+        if len(names) == 0:
+            previews = thumb[np.newaxis]
+        
+        return (image_tensor(sheet[np.newaxis]), image_tensor(previews), "\n".join(names))
+
+    def make_thumbnail(self, img, thumbnail_size):
+        """Area-downsample an image so its longest side is at most thumbnail_size."""
+        h, w = img.shape[:2]
+        scale = thumbnail_size / max(h, w)
+        if scale >= 1:
+            return np.ascontiguousarray(img[:, :, :3], dtype=np.float32)
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        return cv2.resize(np.ascontiguousarray(img[:, :, :3], dtype=np.float32), size,
+                          interpolation=cv2.INTER_AREA)
+
+    def create_grid(self, cells, labels, columns):
+        """Lay out (N, h, w, 3) cells in a grid with optional labels under each cell."""
+        count, h, w = cells.shape[:3]
+        columns = max(1, min(columns, count))
+        rows = (count + columns - 1) // columns
+        gap = 4
+        label_h = 18 if labels else 0
+        cell_h = h + label_h
+        
+        sheet = np.full((rows * (cell_h + gap) + gap, columns * (w + gap) + gap, 3), 26, dtype=np.uint8)
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        max_chars = max(4, w // 7)
+        
+        for i in range(count):
+            y = gap + (i // columns) * (cell_h + gap)
+            x = gap + (i % columns) * (w + gap)
+            sheet[y:y + h, x:x + w] = (cells[i] * 255 + 0.5).astype(np.uint8)
+            if labels:
+                text = labels[i] if len(labels[i]) <= max_chars else labels[i][:max_chars - 2] + ".."
+                cv2.putText(sheet, text, (x + 2, y + h + 13), font, 0.4, (230, 230, 230), 1, cv2.LINE_AA)
+        
+        return sheet.astype(np.float32) / 255.0
@@ -1,9 +1,9 @@
-import torch
 import numpy as np
 import cv2
 from PIL import Image
 import folder_paths
 import os
+from .image_utils import image_view, image_tensor, mask_batch, mask_channels, to_uint8
 
 class RemoveBackgroundPro:
     """
@@ -103,75 +103,49 @@ class RemoveBackgroundPro:
         
         # Import rembg here to avoid loading if not used
         try:
-            from rembg import remove, new_session
+            from rembg import new_session
         except ImportError:
             raise ImportError("rembg is required. Install with: pip install rembg")
         
-        # Convert tensor to PIL
-        img_np = (image[0].cpu().numpy() * 255).astype(np.uint8)
-        img_pil = Image.fromarray(img_np, mode='RGB')
-        
-        # Create session with selected model
+        # Create session with selected model once for the whole batch
         session = new_session(model)
         
-        # Remove background
-        if alpha_matting:
-            result_pil = remove(
-                img_pil,
-                session=session,
-                alpha_matting=True,
-                alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
-                alpha_matting_background_threshold=alpha_matting_background_threshold,
-                alpha_matting_erode_size=alpha_matting_erode_size
-            )
-        else:
-            result_pil = remove(img_pil, session=session)
-        
-        # Convert to numpy and extract alpha channel as mask
-        result_np = np.array(result_pil)
-        
-        # Get original image dimensions
-        orig_h, orig_w = img_np.shape[:2]
-        
-        if result_np.shape[2] == 4:
-            # Has alpha channel
-            mask = result_np[:, :, 3].astype(np.float32) / 255.0
-            rgb = result_np[:, :, :3]
-        else:
-            # No alpha, create mask from non-zero pixels
-            mask = np.any(result_np > 0, axis=2).astype(np.float32)
-            rgb = result_np
-        
-        # Resize mask to match original image if needed
-        if mask.shape[0] != orig_h or mask.shape[1] != orig_w:
-            mask = cv2.resize(mask, (orig_w, orig_h), interpolation=cv2.INTER_LINEAR)
-        
-        # Apply mask editing
-        mask = self.edit_mask(mask, grow_shrink, blur_radius, fill_holes, hole_size_threshold)
-        
-        # Invert if requested
-        if invert_mask:
-            mask = 1.0 - mask
-        
-        # Create outputs
-        h, w = img_np.shape[:2]
+        images = to_uint8(image_view(image))
+        mask = np.empty(images.shape[:3], dtype=np.float32)
+        for i, img_np in enumerate(images):
+            frame_mask = self.segment_frame(img_np, session, alpha_matting,
+                                            alpha_matting_foreground_threshold,
+                                            alpha_matting_background_threshold,
+                                            alpha_matting_erode_size)
+            
+            # Apply mask editing
+            frame_mask = self.edit_mask(frame_mask, grow_shrink, blur_radius, fill_holes, hole_size_threshold)
+            
+            # Invert if requested
+            if invert_mask:
+                frame_mask = 1.0 - frame_mask
+            
+            mask[i] = frame_mask
         
         # Passthrough (original image)
         passthrough = image
         
         # Masked image (RGB with transparency applied - checkerboard for transparency)
-        mask_3ch = np.stack([mask, mask, mask], axis=2)
-        masked_rgb = (img_np.astype(np.float32) / 255.0) * mask_3ch
-        masked_image = torch.from_numpy(masked_rgb).unsqueeze(0)
+        mask_3ch = mask_channels(mask)
+        masked_rgb = np.divide(images, np.float32(255.0), dtype=np.float32)
+        masked_rgb *= mask_3ch
+        masked_image = image_tensor(masked_rgb)
         
         # Mask output (single channel)
-        mask_tensor = torch.from_numpy(mask).unsqueeze(0)
+        mask_tensor = image_tensor(mask)
         
         # Black and white mask image (3 channel for preview)
-        mask_bw = np.stack([mask, mask, mask], axis=2)
-        mask_bw_tensor = torch.from_numpy(mask_bw).unsqueeze(0)
+        mask_bw = mask_channels(mask)
+        mask_bw_tensor = image_tensor(mask_bw)
         
-        # Create preview image based on preview_mode
+        # Create preview image of the first frame based on preview_mode
+        img_np = images[0]
+        mask = mask[0]
         if preview_mode == "transparency_grid":
             preview_img = self.create_transparency_grid_preview(img_np, mask)
         elif preview_mode == "black_bg":
@@ -182,7 +156,7 @@ class RemoveBackgroundPro:
             # Return RGBA image with actual transparency (PNG with alpha)
             preview_img = self.create_rgba_preview(img_np, mask)
         elif preview_mode == "mask_bw":
-            preview_img = (mask_bw * 255).astype(np.uint8)
+            preview_img = to_uint8(mask_bw[0])
         else:  # original
             preview_img = img_np
         
@@ -194,6 +168,47 @@ class RemoveBackgroundPro:
             "result": (passthrough, masked_image, mask_tensor, mask_bw_tensor)
         }
 
+    def segment_frame(self, img_np, session, alpha_matting,
+                      alpha_matting_foreground_threshold,
+                      alpha_matting_background_threshold,
+                      alpha_matting_erode_size):
+        """Run rembg on one uint8 RGB frame and return its float mask."""
+        from rembg import remove
+        
+        img_pil = Image.fromarray(img_np, mode='RGB')
+        
+        # Remove background
+        if alpha_matting:
+            result_pil = remove(
+                img_pil,
+                session=session,
+                alpha_matting=True,
+                alpha_matting_foreground_threshold=alpha_matting_foreground_threshold,
+                alpha_matting_background_threshold=alpha_matting_background_threshold,
+                alpha_matting_erode_size=alpha_matting_erode_size
+            )
+        else:
+            result_pil = remove(img_pil, session=session)
+        
+        # Convert to numpy and extract alpha channel as mask
+        result_np = np.array(result_pil)
+        
+        # Get original image dimensions
+        orig_h, orig_w = img_np.shape[:2]
+        
+        if result_np.shape[2] == 4:
+            # Has alpha channel
+            mask = result_np[:, :, 3].astype(np.float32) / 255.0
+        else:
+            # No alpha, create mask from non-zero pixels
+            mask = np.any(result_np > 0, axis=2).astype(np.float32)
+        
+        # Resize mask to match original image if needed
+        if mask.shape[0] != orig_h or mask.shape[1] != orig_w:
+            mask = cv2.resize(mask, (orig_w, orig_h), interpolation=cv2.INTER_LINEAR)
+        
+        return mask
+
     def create_transparency_grid_preview(self, img_np, mask):
         """Create preview with soft transparency grid background."""
         h, w = img_np.shape[:2]
@@ -210,7 +225,7 @@ class RemoveBackgroundPro:
                 grid[y:y_end, x:x_end] = color
         
         # Composite image over grid
-        mask_3ch = np.stack([mask, mask, mask], axis=2)
+        mask_3ch = mask_channels(mask)
         preview = (img_np.astype(np.float32) * mask_3ch + 
                    grid.astype(np.float32) * (1 - mask_3ch))
         
@@ -223,7 +238,7 @@ class RemoveBackgroundPro:
         # Create RGBA array
         rgba = np.zeros((h, w, 4), dtype=np.uint8)
         rgba[:, :, :3] = img_np
-        rgba[:, :, 3] = (mask * 255).astype(np.uint8)
+        rgba[:, :, 3] = to_uint8(mask)
         
         return rgba
 
@@ -235,7 +250,7 @@ class RemoveBackgroundPro:
         background = np.full((h, w, 3), bg_color, dtype=np.uint8)
         
         # Composite image over background
-        mask_3ch = np.stack([mask, mask, mask], axis=2)
+        mask_3ch = mask_channels(mask)
         preview = (img_np.astype(np.float32) * mask_3ch + 
                    background.astype(np.float32) * (1 - mask_3ch))
         
@@ -267,7 +282,7 @@ class RemoveBackgroundPro:
         """Apply mask editing operations."""
         
         # Convert to uint8 for OpenCV operations
-        mask_uint8 = (mask * 255).astype(np.uint8)
+        mask_uint8 = to_uint8(mask)
         
         # Fill holes
         if fill_holes:
@@ -363,20 +378,39 @@ class MaskEditor:
     def edit_mask(self, mask, grow_shrink=0, blur_radius=0.0, fill_holes=False,
                   hole_size_threshold=500, invert=False, threshold=0.5, apply_threshold=False):
         
-        # Handle batch dimension
-        if len(mask.shape) == 3:
-            mask_np = mask[0].cpu().numpy()
-        else:
-            mask_np = mask.cpu().numpy()
-        
-        mask_np = mask_np.astype(np.float32)
+        # Handle batch dimension, every mask in the batch is edited
+        mask_np = image_view(mask)
+        if mask_np.ndim == 2:
+            mask_np = mask_np[np.newaxis]
         
         # Ensure 0-1 range
         if mask_np.max() > 1.0:
             mask_np = mask_np / 255.0
         
+        result = np.empty(mask_np.shape, dtype=np.float32)
+        for i, m in enumerate(mask_np):
+            result[i] = self.edit_mask_frame(m, grow_shrink, blur_radius, fill_holes, hole_size_threshold)
+        
+        # Apply threshold
+        if apply_threshold:
+            result = (result > threshold).astype(np.float32)
+        
+        # Invert
+        if invert:
+            result = 1.0 - result
+        
+        # Create outputs
+        mask_tensor = image_tensor(result)
+        
+        # Preview (3 channel)
+        preview = mask_channels(result)
+        preview_tensor = image_tensor(preview)
+        
+        return (mask_tensor, preview_tensor)
+
+    def edit_mask_frame(self, mask_np, grow_shrink, blur_radius, fill_holes, hole_size_threshold):
         # Convert to uint8 for OpenCV
-        mask_uint8 = (mask_np * 255).astype(np.uint8)
+        mask_uint8 = to_uint8(mask_np)
         
         # Fill holes
         if fill_holes:
@@ -400,24 +434,7 @@ class MaskEditor:
             mask_uint8 = cv2.GaussianBlur(mask_uint8, (ksize, ksize), blur_radius)
         
         # Convert back to float
-        result = mask_uint8.astype(np.float32) / 255.0
-        
-        # Apply threshold
-        if apply_threshold:
-            result = (result > threshold).astype(np.float32)
-        
-        # Invert
-        if invert:
-            result = 1.0 - result
-        
-        # Create outputs
-        mask_tensor = torch.from_numpy(result).unsqueeze(0)
-        
-        # Preview (3 channel)
-        preview = np.stack([result, result, result], axis=2)
-        preview_tensor = torch.from_numpy(preview).unsqueeze(0)
-        
-        return (mask_tensor, preview_tensor)
+        return mask_uint8.astype(np.float32) / 255.0
 
 
 class ApplyMask:
@@ -448,46 +465,30 @@ class ApplyMask:
     def apply_mask(self, image, mask, background="transparent", 
                    bg_color_r=0, bg_color_g=0, bg_color_b=0, invert_mask=False):
         
-        img = image[0].cpu().numpy()
-        
-        # Handle mask dimensions
-        if len(mask.shape) == 3:
-            mask_np = mask[0].cpu().numpy()
-        else:
-            mask_np = mask.cpu().numpy()
-        
-        # Resize mask if needed
-        if mask_np.shape[:2] != img.shape[:2]:
-            mask_np = cv2.resize(mask_np, (img.shape[1], img.shape[0]))
+        # Masks broadcast over the batch (one mask for all frames, or one per frame)
+        img = image_view(image)
+        batch, h, w = img.shape[:3]
+        mask_np = mask_batch(mask, batch, h, w)
         
         # Invert if requested
         if invert_mask:
             mask_np = 1.0 - mask_np
         
         # Create background
-        h, w = img.shape[:2]
-        if background == "black":
-            bg = np.zeros((h, w, 3), dtype=np.float32)
-        elif background == "white":
-            bg = np.ones((h, w, 3), dtype=np.float32)
+        if background == "white":
+            bg = np.ones(3, dtype=np.float32)
         elif background == "color":
-            bg = np.zeros((h, w, 3), dtype=np.float32)
-            bg[:, :, 0] = bg_color_r / 255.0
-            bg[:, :, 1] = bg_color_g / 255.0
-            bg[:, :, 2] = bg_color_b / 255.0
-        else:  # transparent - use black
-            bg = np.zeros((h, w, 3), dtype=np.float32)
+            bg = np.array([bg_color_r, bg_color_g, bg_color_b], dtype=np.float32) / 255.0
+        else:  # black, transparent - use black
+            bg = np.zeros(3, dtype=np.float32)
         
         # Apply mask
-        mask_3ch = np.stack([mask_np, mask_np, mask_np], axis=2)
-        masked = img * mask_3ch + bg * (1 - mask_3ch)
-        
-        # Create RGBA output (for transparent background)
-        rgba = np.zeros((h, w, 4), dtype=np.float32)
-        rgba[:, :, :3] = img
-        rgba[:, :, 3] = mask_np
+        mask_3ch = mask_channels(mask_np)
+        masked = img[..., :3] * mask_3ch
+        masked += bg * (1 - mask_3ch)
         
-        masked_tensor = torch.from_numpy(masked).unsqueeze(0)
-        rgba_tensor = torch.from_numpy(rgba[:, :, :3]).unsqueeze(0)  # Return RGB, mask is separate
+        masked_tensor = image_tensor(masked)
+        # Return RGB, mask is separate; a 3 channel input is passed through untouched
+        rgba_tensor = image if img.shape[-1] == 3 else image_tensor(img[..., :3])
         
         return (masked_tensor, rgba_tensor)
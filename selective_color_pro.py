@@ -1,6 +1,6 @@
-import torch
 import numpy as np
 import cv2
+from .image_utils import image_view, image_tensor, mask_batch
 
 class SelectiveColorPro:
     """
@@ -32,12 +32,14 @@ class SelectiveColorPro:
     FUNCTION = "apply_selective_color"
     CATEGORY = "MachinePaintingNodes/Color"
 
-    def get_color_mask(self, img_rgb, target_color):
+    def get_color_mask(self, img_rgb, target_color, smooth=True):
         """
         Create a smooth mask for the target color range.
         Uses RGB-based color detection with smooth falloff like Photoshop.
+        Works on a single [H, W, C] image or a [B, H, W, C] batch.
+        smooth=False skips the spatial blur, for inputs that are not images (e.g. a LUT lattice).
         """
-        r, g, b = img_rgb[:,:,0], img_rgb[:,:,1], img_rgb[:,:,2]
+        r, g, b = img_rgb[..., 0], img_rgb[..., 1], img_rgb[..., 2]
         
         # Calculate color components
         max_rgb = np.maximum(np.maximum(r, g), b)
@@ -105,10 +107,13 @@ class SelectiveColorPro:
             neutral_light = np.clip(neutral_light, 0, 1)
             mask = neutral_sat * neutral_light
         
-        # Smooth the mask slightly to avoid any harsh edges
-        mask = cv2.GaussianBlur(mask.astype(np.float32), (3, 3), 0)
-        
-        return mask
+        # Smooth the mask slightly to avoid any harsh edges (per frame for batches)
+        mask = mask.astype(np.float32)
+        if not smooth:
+            return mask
+        if mask.ndim == 3:
+            return np.stack([cv2.GaussianBlur(m, (3, 3), 0) for m in mask])
+        return cv2.GaussianBlur(mask, (3, 3), 0)
 
     def apply_cmyk_adjustment(self, img, color_mask, cyan, magenta, yellow, black):
         """
@@ -124,7 +129,7 @@ class SelectiveColorPro:
         k_adj = black / 100.0
         
         # Expand mask to 3 channels
-        mask = color_mask[:, :, np.newaxis]
+        mask = color_mask[..., np.newaxis]
         
         # CMYK to RGB relationship:
         # Cyan reduces Red
@@ -135,16 +140,16 @@ class SelectiveColorPro:
         # Apply adjustments proportionally to mask and current pixel values
         # Positive cyan = reduce red, Negative cyan = add red
         if c_adj != 0:
-            adjustment = c_adj * mask * result[:,:,0:1]
-            result[:,:,0:1] = result[:,:,0:1] - adjustment
+            adjustment = c_adj * mask * result[..., 0:1]
+            result[..., 0:1] = result[..., 0:1] - adjustment
             
         if m_adj != 0:
-            adjustment = m_adj * mask * result[:,:,1:2]
-            result[:,:,1:2] = result[:,:,1:2] - adjustment
+            adjustment = m_adj * mask * result[..., 1:2]
+            result[..., 1:2] = result[..., 1:2] - adjustment
             
         if y_adj != 0:
-            adjustment = y_adj * mask * result[:,:,2:3]
-            result[:,:,2:3] = result[:,:,2:3] - adjustment
+            adjustment = y_adj * mask * result[..., 2:3]
+            result[..., 2:3] = result[..., 2:3] - adjustment
         
         # Black adjustment affects luminosity
         if k_adj != 0:
@@ -163,8 +168,9 @@ class SelectiveColorPro:
     def apply_selective_color(self, image, target_color, cyan, magenta, yellow, black, 
                                mask=None, invert_mask=False):
         
-        img = image[0].cpu().numpy().astype(np.float32)
-        original = img.copy()
+        # Color masks and CMYK adjustments run on the whole [B, H, W, C] batch at once
+        img = image_view(image)
+        original = img
         
         # Get smooth color mask
         color_mask = self.get_color_mask(img, target_color)
@@ -174,21 +180,16 @@ class SelectiveColorPro:
         
         # Apply external mask if provided
         if mask is not None:
-            if len(mask.shape) == 3:
-                mask_np = mask[0].cpu().numpy()
-            else:
-                mask_np = mask.cpu().numpy()
-            
-            if mask_np.shape[:2] != img.shape[:2]:
-                mask_np = cv2.resize(mask_np, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR)
+            batch, height, width = img.shape[:3]
+            mask_np = mask_batch(mask, batch, height, width)
             
             if invert_mask:
                 mask_np = 1.0 - mask_np
             
-            mask_3ch = mask_np[:, :, np.newaxis]
+            mask_3ch = mask_np[..., np.newaxis]
             result = original * (1 - mask_3ch) + result * mask_3ch
         
-        result = np.clip(result, 0, 1)
-        result_tensor = torch.from_numpy(result).unsqueeze(0)
+        np.clip(result, 0, 1, out=result)
+        result_tensor = image_tensor(result)
         
         return (result_tensor,)
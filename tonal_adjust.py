@@ -1,6 +1,7 @@
-import torch
 import numpy as np
 import cv2
+from .image_utils import image_view, image_tensor
+from .tone_lut import tone_lut
 
 class LevelsAdjust:
     """
@@ -25,12 +26,11 @@ class LevelsAdjust:
     FUNCTION = "adjust_levels"
     CATEGORY = "MachinePaintingNodes/Color"
 
-    def adjust_levels(self, image, black_point=0.0, white_point=1.0, gamma=1.0, 
-                      output_black=0.0, output_white=1.0):
-        img = image[0].cpu().numpy().astype(np.float32)
-        
+    @staticmethod
+    def levels(values, black_point, white_point, gamma, output_black, output_white):
+        """The levels transform on raw values; baked into a cached tone LUT by adjust_levels."""
         # Input levels
-        result = (img - black_point) / (white_point - black_point)
+        result = (values - black_point) / (white_point - black_point)
         result = np.clip(result, 0, 1)
         
         # Gamma
@@ -39,9 +39,15 @@ class LevelsAdjust:
         
         # Output levels
         result = result * (output_white - output_black) + output_black
-        result = np.clip(result, 0, 1)
+        return np.clip(result, 0, 1)
+
+    def adjust_levels(self, image, black_point=0.0, white_point=1.0, gamma=1.0, 
+                      output_black=0.0, output_white=1.0):
+        # Pure per-value transform: one table lookup for the whole [B, H, W, C] batch
+        lut = tone_lut(self.levels, (black_point, white_point, gamma, output_black, output_white))
+        result = lut.apply(image_view(image))
         
-        result_tensor = torch.from_numpy(result).unsqueeze(0)
+        result_tensor = image_tensor(result)
         return (result_tensor,)
 
 
@@ -66,9 +72,21 @@ class AutoLevels:
     CATEGORY = "MachinePaintingNodes/Color"
 
     def auto_levels(self, image, clip_percent=0.1, strength=1.0):
-        img = image[0].cpu().numpy().astype(np.float32)
-        original = img.copy()
+        img = image_view(image)
+        
+        # Clip points come from each frame's own histogram
+        result = np.empty_like(img)
+        for i, frame in enumerate(img):
+            result[i] = self.auto_levels_frame(frame, clip_percent)
         
+        # Blend with original based on strength
+        result = img * (1 - strength) + result * strength
+        np.clip(result, 0, 1, out=result)
+        
+        result_tensor = image_tensor(result)
+        return (result_tensor,)
+
+    def auto_levels_frame(self, img, clip_percent):
         result = np.zeros_like(img)
         
         for c in range(3):
@@ -96,12 +114,7 @@ class AutoLevels:
             else:
                 result[:, :, c] = channel
         
-        # Blend with original based on strength
-        result = original * (1 - strength) + result * strength
-        result = np.clip(result, 0, 1)
-        
-        result_tensor = torch.from_numpy(result).unsqueeze(0)
-        return (result_tensor,)
+        return result
 
 
 class BrightnessContrastAdjust:
@@ -122,17 +135,22 @@ class BrightnessContrastAdjust:
     FUNCTION = "adjust"
     CATEGORY = "MachinePaintingNodes/Color"
 
-    def adjust(self, image, brightness, contrast):
-        img = image[0].cpu().numpy().astype(np.float32)
-        
+    @staticmethod
+    def brightness_contrast(values, brightness, contrast):
+        """The brightness/contrast transform on raw values."""
         # Brightness (-100 to 100 -> -0.5 to 0.5)
-        result = img + (brightness / 200.0)
+        result = values + (brightness / 200.0)
         
         # Contrast (-100 to 100 -> 0.5 to 1.5 factor)
         factor = 1.0 + (contrast / 100.0)
         result = (result - 0.5) * factor + 0.5
         
-        result = np.clip(result, 0, 1)
-        result_tensor = torch.from_numpy(result).unsqueeze(0)
+        return np.clip(result, 0, 1)
+
+    def adjust(self, image, brightness, contrast):
+        # Linear with a final clip, so values outside 0-1 follow the end segments of the table
+        lut = tone_lut(self.brightness_contrast, (brightness, contrast), extrapolate=True)
+        result = lut.apply(image_view(image))
         
+        result_tensor = image_tensor(result)
         return (result_tensor,)